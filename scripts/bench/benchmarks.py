@@ -0,0 +1,185 @@
+'''
+Benchmark suite for the smoothers, FWE procedures and the Simulator inner loop.
+
+Each benchmark is timed (best per-call time over repeated calls, after two
+warm-up calls so that cached filter designs, bases and thresholds are reused
+as they are in simulation sweeps) and its peak memory (tracemalloc) is
+measured during one additional call.
+
+Results are compared with a stored baseline (baseline.json, in this directory);
+benchmarks slower or more memory-hungry than the baseline by more than the
+tolerance factor are reported as regressions, and the script then exits with
+status 1.  The stored baseline is machine-specific:  regenerate it (--save)
+on the machine used for comparisons.
+
+Usage:
+
+	python benchmarks.py                  #run all benchmarks and compare with the baseline
+	python benchmarks.py -k butter        #run benchmarks whose names contain "butter"
+	python benchmarks.py --save           #run all benchmarks and save them as the baseline
+	python benchmarks.py --tolerance 2    #flag regressions only if more than 2x slower / larger
+'''
+
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+import smooth1d
+
+
+
+
+#(0) Benchmark grid:
+JJ          = [5, 20]      #sample sizes
+QQ          = [101, 501]   #continuum sizes
+NN          = [1, 10]      #iterations (stacked samples)
+alpha       = 0.05
+fname_baseline = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+
+
+#(1) Benchmark definitions:
+def _sample(N, J, Q, seed=0):
+	rng     = np.random.default_rng(seed)
+	t       = np.linspace(0, 1, Q)
+	y0      = np.sin(2 * np.pi * t)
+	y       = y0 + 0.1 * rng.standard_normal((N, J, Q))
+	return t, y0, y
+
+
+def _simulator(filter_name, params, J):
+	sim     = smooth1d.sim.Simulator()
+	sim.set_alpha(alpha)
+	sim.set_dataset_name('Challis1999e')
+	sim.set_filter(filter_name, params=params)
+	sim.set_seed(0)
+	sim.set_sample_size(J)
+	sim.set_noise_amp(0.1)
+	return sim
+
+
+def _simulate(sim, N):
+	sim.results = smooth1d.sim.SimulationResults()
+	sim.set_seed(0)   #same noise for every call
+	sim.simulate(N, batch_size=N)
+
+
+def get_benchmarks():
+	'''
+	Returns a list of (name, fn) pairs, where fn() runs one benchmark call
+	'''
+	smooth  = smooth1d.smooth
+	util    = smooth1d.util
+	fwe     = smooth1d.fwe
+	b       = []
+	for N,J,Q in itertools.product(NN, JJ, QQ):
+		t,y0,y = _sample(N, J, Q)
+		dt     = t[1] - t[0]
+		grid   = '[N=%d,J=%d,Q=%d]' %(N,J,Q)
+		b.append( ('smooth.butter_lowpass' + grid,  lambda y=y,dt=dt: smooth.butter_lowpass(y, dt, 5, order=2)) )
+		b.append( ('smooth.autocorr' + grid,        lambda y=y,t=t: smooth.autocorr(y, order=2, time=t)) )
+		b.append( ('smooth.gcvspl' + grid,          lambda y=y,t=t: smooth.gcvspl(t, y, m=2)) )
+		b.append( ('smooth.ssa' + grid,             lambda y=y: smooth.ssa(y, 5, 2)) )
+		b.append( ('smooth.ssa_windowed' + grid,    lambda y=y: smooth.ssa_windowed(y, 5, 2, window=50)) )
+		b.append( ('smooth.wavelet' + grid,         lambda y=y: smooth.wavelet(y)) )
+		b.append( ('smooth.wiener' + grid,          lambda y=y: smooth.wiener(y)) )
+		b.append( ('smooth.embed' + grid,           lambda y=y,t=t: smooth.embed(t, y.reshape(-1,y.shape[-1]))) )
+		b.append( ('util.prmse' + grid,             lambda y=y,y0=y0: util.prmse(y0, y)) )
+		b.append( ('util.tstat' + grid,             lambda y=y,y0=y0: util.tstat(y - y0)) )
+		for name in sorted(fwe.procedures):
+			b.append( ('fwe.%s%s' %(name,grid),     lambda y=y,y0=y0,name=name: fwe.inference(y, y0, name, alpha=alpha)) )
+	for N,J in itertools.product([10, 100], JJ):
+		for filter_name,params in [('None',None), ('Butterworth',dict(cutoff=5, order=2))]:
+			grid   = '[%s,N=%d,J=%d]' %(filter_name,N,J)
+			sim    = _simulator(filter_name, params, J)
+			b.append( ('Simulator.simulate' + grid, lambda sim=sim,N=N: _simulate(sim, N)) )
+	return b
+
+
+
+
+#(2) Measurement:
+def measure(fn, min_time=0.2, max_calls=100, warmup=2, min_calls=3):
+	'''
+	Returns the best per-call time (s) and the peak memory (bytes) of fn()
+	
+	fn is called "warmup" times before timing, so that caches reach their steady
+	state:  some operators are only built on their second request (see
+	smooth1d.smooth._butter_matrix), so the second call can be the slowest.
+	At least "min_calls" calls are then timed.
+	'''
+	for i in range(warmup):
+		fn()
+	times   = []
+	t0      = time.perf_counter()
+	while (len(times) < min_calls) or ( (len(times) < max_calls) and (time.perf_counter() - t0 < min_time) ):
+		t   = time.perf_counter()
+		fn()
+		times.append( time.perf_counter() - t )
+	tracemalloc.start()
+	fn()
+	peak    = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return min(times), peak
+
+
+def run(pattern=None):
+	results = {}
+	for name,fn in get_benchmarks():
+		if (pattern is not None) and (pattern not in name):
+			continue
+		dt,peak = measure(fn)
+		results[name] = dict(time=dt, peak=peak)
+		print('%-55s %11.3f ms %11.2f MB' %(name, 1e3*dt, peak/1e6))
+		sys.stdout.flush()
+	return results
+
+
+def compare(results, baseline, tolerance=1.5):
+	'''
+	Returns a list of regression descriptions (benchmarks slower or larger than the baseline by more than "tolerance")
+	'''
+	regressions = []
+	for name,r in results.items():
+		if name not in baseline:
+			continue
+		for key,label in [('time','time'), ('peak','peak memory')]:
+			r0  = baseline[name][key]
+			if (r0 > 0) and (r[key] > tolerance * r0):
+				regressions.append( '%s:  %s %.2fx baseline' %(name, label, r[key]/r0) )
+	return regressions
+
+
+
+
+#(3) Run:
+if __name__ == '__main__':
+	parser  = argparse.ArgumentParser(description='smooth1d benchmarks')
+	parser.add_argument('-k', dest='pattern', default=None, help='run only benchmarks whose names contain this string')
+	parser.add_argument('--save', action='store_true', help='save the results as the baseline')
+	parser.add_argument('--tolerance', type=float, default=1.5, help='regression tolerance factor (time and peak memory)')
+	args    = parser.parse_args()
+	results = run(args.pattern)
+	if args.save:
+		info = dict(python=platform.python_version(), numpy=np.__version__, machine=platform.machine(), processor=platform.processor(), cpu_count=os.cpu_count())
+		with open(fname_baseline, 'w') as f:
+			json.dump(dict(info=info, results=results), f, indent=1, sort_keys=True)
+		print('Baseline saved:  %s' %fname_baseline)
+	elif os.path.exists(fname_baseline):
+		with open(fname_baseline, 'r') as f:
+			baseline = json.load(f)['results']
+		regressions = compare(results, baseline, args.tolerance)
+		print('\n%d regression(s) relative to %s' %(len(regressions), fname_baseline))
+		for s in regressions:
+			print('   ' + s)
+		sys.exit( 1 if len(regressions) > 0 else 0 )
+	else:
+		print('\nNo baseline found (%s);  use --save to create one.' %fname_baseline)
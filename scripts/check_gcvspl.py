@@ -0,0 +1,98 @@
+'''
+This script checks the two GCVSPL engines in smooth1d.smooth against each
+other and against an independent implementation
+
+1. Fixed smoothing parameter, m=2:  dense and banded engines versus
+   scipy.interpolate.make_smoothing_spline (natural cubic smoothing spline)
+2. Fixed smoothing parameter, m=1 to 5:  banded versus dense engine (fitted
+   values and trace of the influence matrix;  the banded trace loses accuracy
+   as lam and m increase, so it is compared relative to trace( I - A ) <= n-m,
+   the GCV denominator)
+3. Very large smoothing parameter, m=2 to 5:  both engines versus the
+   polynomial limit (the least-squares polynomial of degree m-1);  the banded
+   system is numerically singular for such lam unless Q is small, so the
+   banded engine is checked only for Q=128
+4. GCV search, m=2 to 5:  banded versus dense engine;  for m=5 the banded
+   trace is not accurate enough for very smooth fits (see
+   smooth._gcvspl_banded), so the difference is reported but not checked
+
+The smoothing parameter "lam" in smooth1d is expressed in node units (the
+nodes are rescaled to 0 ... n-1);  for scipy's natural cubic spline (whose
+penalty is in the units of x) the equivalent parameter is lam / s**3, where
+s = (n-1) / (x[-1] - x[0]).
+
+The script raises an AssertionError (exit status 1) if any check fails.
+'''
+
+
+import numpy as np
+import scipy.interpolate
+from smooth1d import smooth
+
+
+
+#(0) Test data (non-uniform nodes):
+rng      = np.random.default_rng(0)
+n        = 201
+x        = np.sort( rng.uniform(0, 2, n) )
+x[[0,-1]] = 0, 2
+y0       = np.sin(2*np.pi*x)
+y        = y0 + 0.1*rng.standard_normal( (5,n) )
+s        = (n - 1) / (x[-1] - x[0])
+
+
+
+#(1) Fixed smoothing parameter, m=2 (natural cubic spline):
+for lam in [1e-2, 1, 1e2, 1e4]:
+	ys0  = np.array([scipy.interpolate.make_smoothing_spline(x, yy, lam=lam/s**3)(x)  for yy in y])
+	ysd  = smooth._gcvspl_dense_fit(x, y, 2, lam)
+	ysb  = smooth._gcvspl_banded_fit(x, y, 2, lam)
+	ed,eb = abs(ysd - ys0).max(), abs(ysb - ys0).max()
+	print('m=2, lam=%.0e:   max|dense-scipy| = %.1e,   max|banded-scipy| = %.1e' %(lam, ed, eb))
+	assert eb < 1e-8, 'Banded engine does not match scipy.interpolate.make_smoothing_spline (lam=%r)' %lam
+	assert ed < 1e-6, 'Dense engine does not match scipy.interpolate.make_smoothing_spline (lam=%r)' %lam
+
+
+
+#(2) Fixed smoothing parameter, m=1 to 5:
+for m in [1, 2, 3, 4, 5]:
+	for lam in [1e-1, 1e1, 1e3, 1e5]:
+		d,U    = smooth._gcvspl_basis( np.ascontiguousarray(x).tobytes(), m )
+		trd    = ( 1 / (1 + lam * d) ).sum()
+		ysd    = smooth._gcvspl_dense_fit(x, y, m, lam)
+		ysb,trb = smooth._gcvspl_banded_fit(x, y, m, lam, trace=True)
+		e,etr  = abs(ysb - ysd).max(), abs(trb - trd) / (n - m)
+		print('m=%d, lam=%.0e:   max|banded-dense| = %.1e,   |trace difference| / (n-m) = %.1e' %(m, lam, e, etr))
+		assert e < 1e-7, 'Banded and dense fitted values differ (m=%d, lam=%r)' %(m, lam)
+		assert etr < 1e-3, 'Banded and dense traces differ (m=%d, lam=%r)' %(m, lam)
+
+
+
+#(3) Very large smoothing parameter (polynomial limit), Q=128 and Q=500:
+for Q in [128, 500]:
+	xx     = np.linspace(0, 1, Q)
+	yy     = np.sin(5*xx) + 0.1*rng.standard_normal(Q)
+	for m in [2, 3, 4, 5]:
+		V      = np.vander(xx, m)
+		yp     = V @ np.linalg.lstsq(V, yy, rcond=None)[0]
+		ed     = abs( smooth._gcvspl_dense_fit(xx, yy, m, 1e14 * (Q/100)**(2*m)) - yp ).max()
+		print('Q=%d, m=%d, polynomial limit:   max|dense-poly| = %.1e' %(Q, m, ed))
+		assert ed < 1e-4, 'Dense engine does not converge to the polynomial limit (Q=%d, m=%d)' %(Q, m)
+		if Q == 128:
+			eb     = abs( smooth._gcvspl_banded_fit(xx, yy, m, 1e14) - yp ).max()
+			print('Q=%d, m=%d, polynomial limit:   max|banded-poly| = %.1e' %(Q, m, eb))
+			assert eb < 1e-3, 'Banded engine does not converge to the polynomial limit (Q=%d, m=%d)' %(Q, m)
+
+
+
+#(4) GCV search:
+for m in [2, 3, 4, 5]:
+	yd     = smooth._gcvspl_dense(x, y, m)
+	yb     = smooth._gcvspl_banded(x, y, m)
+	e      = np.sqrt( ((yb - yd)**2).mean(axis=1) ).max() / 0.1
+	print('m=%d, GCV:   max RMS|banded-dense| / noise SD = %.1e' %(m, e))
+	if m < 5:
+		assert e < 0.05, 'Banded and dense GCV fits differ (m=%d)' %m
+
+
+print('All checks passed.')
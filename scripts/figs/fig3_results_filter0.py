@@ -2,6 +2,7 @@
 import os,pathlib
 import numpy as np
 from matplotlib import pyplot
+import smooth1d
 import smooth1d_plot as myplot
 
 
@@ -9,17 +10,13 @@ import smooth1d_plot as myplot
 #(1) Check all datasets:
 dir0       = pathlib.Path(__file__).parents[2]
 dir0       = os.path.join(dir0, 'simulation_results')
-varnames   = ['h0reject', 'tstar', 'tmax', 'dmax', 'rmse', 'sample_size', 'noise_amp']
+catalog    = smooth1d.catalog.Catalog(dir0)
 H0         = []
 for dataset in range(6):
-	fnameNPZ   = os.path.join(dir0, 'filter0', 'dataset%d_filter0.npz' %dataset)
-	with np.load(fnameNPZ) as Z:
-		h0,tstar,tmax,dmax,rmse,J,amp = [Z[s] for s in varnames]
-		### compute false positive rate as a function of sample size and amplitude:
-		uJ         = np.unique(J)
-		uamp       = np.unique(amp)
-		h          = np.array([[  h0[(J==j) & (amp==a)].mean()    for a in uamp]  for j in uJ])
-		H0.append( 100*h )
+	### false positive rate as a function of sample size and amplitude:
+	(uJ,uamp),h = catalog.fpr(by=('sample_size','noise_amp'), dataset=dataset, filter=0)
+	assert list(uamp) == [0.01, 0.20], 'Dataset %d:  results not found for both noise amplitudes (0.01, 0.20)' %dataset
+	H0.append( h )
 ### plot:
 pyplot.close('all')
 fontname = u'Times New Roman'
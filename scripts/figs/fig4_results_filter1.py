@@ -2,6 +2,7 @@
 import os,pathlib
 import numpy as np
 from matplotlib import pyplot
+import smooth1d
 import smooth1d_plot as myplot
 
 
@@ -12,23 +13,16 @@ import smooth1d_plot as myplot
 filternum  = 1
 dir0       = pathlib.Path(__file__).parents[2]
 dir0       = os.path.join(dir0, 'simulation_results')
-varnames   = ['h0reject', 'tstar', 'tmax', 'dmax', 'rmse', 'sample_size', 'noise_amp']
+catalog    = smooth1d.catalog.Catalog(dir0)
 # cutoffs    = [2, 3, 4, 5, 6, 7, 8, 9, 10]
 cutoffs    = [4, 6, 8, 10]
 order      = 5
 HH0        = []
 for dataset in range(6):
-	H0         = []
-	for cutoff in cutoffs:
-		fnameNPZ   = os.path.join(dir0, 'filter%d'%filternum, 'dataset%d_filter%d_cutoff%d_order%d.npz' %(dataset,filternum,cutoff,order))
-		with np.load(fnameNPZ) as Z:
-			h0,tstar,tmax,dmax,rmse,J,amp = [Z[s] for s in varnames]
-			### compute false positive rate as a function of sample size and amplitude:
-			uJ         = np.unique(J)
-			uamp       = np.unique(amp)
-			h          = np.array([[  h0[(J==j) & (amp==a)].mean()    for a in uamp]  for j in uJ])
-			H0.append( 100*h )
-	HH0.append(H0)
+	### false positive rate as a function of sample size, amplitude and cutoff:
+	(uJ,uamp,ucutoff),h = catalog.fpr(by=('sample_size','noise_amp','cutoff'), dataset=dataset, filter=filternum, cutoff=cutoffs, order=order)
+	assert list(ucutoff) == sorted(cutoffs), 'Dataset %d:  results not found for all cutoffs (%s)' %(dataset, cutoffs)
+	HH0.append( [h[:,:,list(ucutoff).index(x)] for x in cutoffs] )
 ### plot:
 pyplot.close('all')
 fontname = u'Times New Roman'
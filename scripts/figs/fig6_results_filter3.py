@@ -2,6 +2,7 @@
 import os,pathlib
 import numpy as np
 from matplotlib import pyplot
+import smooth1d
 import smooth1d_plot as myplot
 
 
@@ -11,21 +12,14 @@ import smooth1d_plot as myplot
 filternum  = 3
 dir0       = pathlib.Path(__file__).parents[2]
 dir0       = os.path.join(dir0, 'simulation_results')
-varnames   = ['h0reject', 'tstar', 'tmax', 'dmax', 'rmse', 'sample_size', 'noise_amp']
+catalog    = smooth1d.catalog.Catalog(dir0)
 orders     = [2,3,4,5]
 HH0        = []
 for dataset in range(6):
-	H0         = []
-	for order in orders:
-		fnameNPZ   = os.path.join(dir0, 'filter%d'%filternum, 'dataset%d_filter%d_order%d.npz' %(dataset,filternum,order))
-		with np.load(fnameNPZ) as Z:
-			h0,tstar,tmax,dmax,rmse,J,amp = [Z[s] for s in varnames]
-			### compute false positive rate as a function of sample size and amplitude:
-			uJ         = np.unique(J)
-			uamp       = np.unique(amp)
-			h          = np.array([[  h0[(J==j) & (amp==a)].mean()    for a in uamp]  for j in uJ])
-			H0.append( 100*h )
-	HH0.append(H0)
+	### false positive rate as a function of sample size, amplitude and order:
+	(uJ,uamp,uorder),h = catalog.fpr(by=('sample_size','noise_amp','order'), dataset=dataset, filter=filternum, order=orders)
+	assert list(uorder) == sorted(orders), 'Dataset %d:  results not found for all orders (%s)' %(dataset, orders)
+	HH0.append( [h[:,:,list(uorder).index(x)] for x in orders] )
 ### plot:
 pyplot.close('all')
 fontname = u'Times New Roman'
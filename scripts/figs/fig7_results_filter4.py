@@ -2,6 +2,7 @@
 import os,pathlib
 import numpy as np
 from matplotlib import pyplot
+import smooth1d
 import smooth1d_plot as myplot
 
 
@@ -10,7 +11,7 @@ import smooth1d_plot as myplot
 filternum  = 4
 dir0       = pathlib.Path(__file__).parents[2]
 dir0       = os.path.join(dir0, 'simulation_results')
-varnames   = ['h0reject', 'tstar', 'tmax', 'dmax', 'rmse', 'sample_size', 'noise_amp']
+catalog    = smooth1d.catalog.Catalog(dir0)
 windows    = [5, 10, 15]
 ncomp      = 3
 
@@ -18,18 +19,10 @@ ncomp      = 3
 # window     = 5
 HH0        = []
 for dataset in range(6):
-	H0         = []
-	for window in windows:
-	# for ncomp in ncomponents:
-		fnameNPZ   = os.path.join(dir0, 'filter%d'%filternum, 'dataset%d_filter%d_window%d_ncomponents%d.npz' %(dataset,filternum,window,ncomp))
-		with np.load(fnameNPZ) as Z:
-			h0,tstar,tmax,dmax,rmse,J,amp = [Z[s] for s in varnames]
-			### compute false positive rate as a function of sample size and amplitude:
-			uJ         = np.unique(J)
-			uamp       = np.unique(amp)
-			h          = np.array([[  h0[(J==j) & (amp==a)].mean()    for a in uamp]  for j in uJ])
-			H0.append( 100*h )
-	HH0.append(H0)
+	### false positive rate as a function of sample size, amplitude and window:
+	(uJ,uamp,uwindow),h = catalog.fpr(by=('sample_size','noise_amp','window'), dataset=dataset, filter=filternum, window=windows, ncomponents=ncomp)
+	assert list(uwindow) == sorted(windows), 'Dataset %d:  results not found for all windows (%s)' %(dataset, windows)
+	HH0.append( [h[:,:,list(uwindow).index(x)] for x in windows] )
 ### plot:
 pyplot.close('all')
 fontname = u'Times New Roman'
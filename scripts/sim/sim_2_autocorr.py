@@ -12,32 +12,16 @@ nIterations = 1000
 JJ          = [5, 6, 7, 8, 9, 10, 15, 20, 25, 30, 35, 45, 50] #sample sizes
 noise_amps  = [0.01, 0.20]
 orders      = [2, 3, 4, 5]
-### simulate:
-for order in orders:
-	
-	sim         = smooth1d.sim.Simulator()
-	sim.set_alpha(0.05)
-	# sim.set_dataset_name('Vaughan1982')
-	# sim.set_dataset_name('Challis1999a')
-	# sim.set_dataset_name('Challis1999b')
-	# sim.set_dataset_name('Challis1999c')
-	# sim.set_dataset_name('Challis1999d')
-	sim.set_dataset_name('Challis1999e')
-	sim.set_filter('Autocorr', params=dict(order=order))
-	sim.set_metadata_labels(['sample_size','noise_amp'], types=[int,float])
-	sim.set_results_directory( os.path.dirname(__file__) )
-	sim.set_seed()
-	
-	
-	for J in JJ:
-		for amp in noise_amps:
-			print('AUTOCORR:  Dataset=%d, Order=%d, Sample size=%d, Amp=%.2f' %(sim.get_dataset_index(),order,J,amp))
-			t0 = time.time()
-			sim.set_sample_size( J )
-			sim.set_noise_amp( amp )
-			sim.simulate(nIterations, metadata=[J, amp])
-			sim.save()
-			print('Elapsed time:  %.1f' %(time.time()-t0))
+datasets    = ['Challis1999e']   #any of: 'Vaughan1982', 'Challis1999a', 'Challis1999b', 'Challis1999c', 'Challis1999d', 'Challis1999e'
+### simulate (one process per dataset-order cell):
+sweep       = smooth1d.sim.Sweep('Autocorr', params=dict(order=orders), dataset_names=datasets, sample_sizes=JJ, noise_amps=noise_amps, n_iterations=nIterations)
+sweep.set_alpha(0.05)
+sweep.set_results_directory( os.path.dirname(__file__) )
+sweep.verbose = True
+if __name__ == '__main__':
+	t0 = time.time()
+	sweep.run()
+	print('Elapsed time:  %.1f' %(time.time()-t0))
 
 
 
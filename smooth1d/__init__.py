@@ -12,11 +12,22 @@ Journal of Biomechanics.
 
 __version__ = 0.1   #2018.01.23
 
-from . import datasets
-from . import fwe
-from . import sim
-from . import smooth
-from . import util
+
+### submodules are imported on first access (PEP 562), so that e.g. worker processes
+### which use only smooth1d.smooth do not import spm1d, scipy.stats, pywt etc.
+import importlib
+
+__all__ = ['catalog', 'datasets', 'fwe', 'rft', 'sim', 'smooth', 'util']
+
+
+def __getattr__(name):
+	if name in __all__:
+		return importlib.import_module('.' + name, __name__)
+	raise AttributeError('module %r has no attribute %r' %(__name__, name))
+
+
+def __dir__():
+	return sorted( list(globals()) + __all__ )
 
 
 
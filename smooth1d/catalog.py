@@ -0,0 +1,257 @@
+'''
+catalog.py
+
+An index of simulation results files, with fast group-by aggregation.
+
+Results files saved by smooth1d.sim.Simulator are named:
+
+    datasetD_filterF[_param1VALUE1[_param2VALUE2...]].npz
+
+where parameter values are integers (e.g. "_cutoff4") or floats (e.g. "_cutoff2.5");
+see smooth1d.sim.get_params_string.
+
+A Catalog scans a results directory once, indexes all files by dataset,
+filter and filter parameters, and computes group-by aggregates (e.g. false
+positive rates by sample size and noise amplitude) with vectorized
+bincount kernels. Per-file partial aggregates are cached in memory and on
+disk (keyed by each file's modification time and size), so regenerating
+figures does not reread and reaggregate unchanged files.
+
+Example:
+
+>>> cat = smooth1d.catalog.Catalog('./simulation_results')
+>>> (J,amp,cutoff), fpr = cat.grid('h0reject', by=('sample_size','noise_amp','cutoff'), dataset=0, filter=1, order=5)
+'''
+
+
+import hashlib
+import os
+import re
+import numpy as np
+
+
+_fname_pattern = re.compile(r'^dataset(\d+)_filter(\d+)((?:_[A-Za-z]+\d[\d.e+-]*)*)\.npz$')
+_param_pattern = re.compile(r'_([A-Za-z]+)(\d[\d.e+-]*)')
+
+
+def _parse_param(value):
+	return int(value) if value.isdigit() else float(value)
+
+
+
+
+def groupby(keys, values=None, stat='mean'):
+	'''
+	Vectorized group-by aggregation
+
+	INPUTS:
+
+	*keys* : list of (n,) arrays, one per grouping variable
+
+	*values* : (n,) array (not required if stat is "count")
+
+	*stat* : aggregate statistic ("mean", "sum" or "count")
+
+	OUTPUTS:
+
+	*ukeys* : list of (g,) arrays, unique key combinations
+
+	*x* : (g,) array, aggregate statistic for each key combination
+	'''
+	### integer codes for each key, combined into a single integer code:
+	levels,codes = zip( *[np.unique(k, return_inverse=True)  for k in keys] )
+	code      = np.ravel_multi_index([c.ravel() for c in codes], [u.size for u in levels])
+	ucode,inv = np.unique(code, return_inverse=True)
+	ukeys     = [u[i]  for u,i in zip(levels, np.unravel_index(ucode, [u.size for u in levels]))]
+	count     = np.bincount(inv, minlength=ucode.size)
+	if stat == 'count':
+		return ukeys, count
+	s         = np.bincount(inv, weights=values, minlength=ucode.size)
+	if stat == 'sum':
+		return ukeys, s
+	elif stat == 'mean':
+		return ukeys, s / count
+	raise( ValueError('Unknown statistic: %s' %stat) )
+
+
+def to_grid(ukeys, x):
+	'''
+	Reshape group-by results into an N-dimensional grid
+
+	INPUTS:
+
+	*ukeys* : list of (g,) arrays, key combinations (e.g. as returned by "groupby")
+
+	*x* : (g,) array, aggregate values
+
+	OUTPUTS:
+
+	*levels* : list of arrays, unique values of each key
+
+	*X* : N-dimensional array (missing key combinations are NaN)
+	'''
+	levels    = [np.unique(k)  for k in ukeys]
+	ind       = tuple( np.searchsorted(u, k)  for u,k in zip(levels, ukeys) )
+	X         = np.full([u.size for u in levels], np.nan)
+	X[ind]    = x
+	return levels, X
+
+
+
+
+class Catalog(object):
+	'''
+	Index of simulation results files
+
+	*dir0* : results directory (searched recursively)
+
+	*cache_dir* : directory for cached aggregates (default: a ".catalog" subdirectory of dir0;  None = memory cache only)
+	'''
+	def __init__(self, dir0, cache_dir='default'):
+		self.dir0       = dir0
+		self.cache_dir  = os.path.join(dir0, '.catalog') if (cache_dir == 'default') else cache_dir
+		self.entries    = []   #one dictionary per results file: dataset, filter, params, fname
+		self._cache     = {}   #in-memory partial aggregates
+		self.scan()
+
+	def __repr__(self):
+		return 'Catalog (%d results files in %s)' %(len(self.entries), self.dir0)
+
+	def _partial(self, entry, varname, filekeys):
+		'''
+		Per-file partial aggregates:  (unique file-level keys, sums, counts)
+		'''
+		st        = os.stat(entry['fname'])
+		key       = '%s|%d|%d|%s|%s' %(os.path.relpath(entry['fname'], self.dir0), st.st_mtime_ns, st.st_size, varname, ','.join(filekeys))
+		if key in self._cache:
+			return self._cache[key]
+		fnameC    = None
+		if self.cache_dir is not None:
+			fnameC = os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest() + '.npz')
+			if os.path.exists(fnameC):
+				with np.load(fnameC) as Z:
+					partial = [Z['k%d'%i] for i in range(len(filekeys))], Z['sum'], Z['count']
+				self._cache[key] = partial
+				return partial
+		with np.load(entry['fname']) as Z:
+			values    = np.asarray(Z[varname], dtype=float)
+			keys      = [Z[s]  for s in filekeys] if len(filekeys)>0 else [np.zeros(values.size, dtype=int)]
+		ukeys,s   = groupby(keys, values, stat='sum')
+		count     = groupby(keys, stat='count')[1]
+		ukeys     = ukeys if len(filekeys)>0 else []
+		partial   = ukeys, s, count
+		if fnameC is not None:
+			os.makedirs(self.cache_dir, exist_ok=True)
+			with open(fnameC + '.tmp', 'wb') as f:
+				np.savez(f, sum=s, count=count, **{'k%d'%i:k  for i,k in enumerate(ukeys)})
+			os.replace(fnameC + '.tmp', fnameC)
+		self._cache[key] = partial
+		return partial
+
+	def aggregate(self, varname='h0reject', by=('sample_size','noise_amp'), stat='mean', **selection):
+		'''
+		Group-by aggregation across all selected results files
+
+		INPUTS:
+
+		*varname* : results variable name (e.g. "h0reject", "rmse")
+
+		*by* : grouping variables;  results variables (e.g. "sample_size") and/or
+		file-level variables ("dataset", "filter" or filter parameter names)
+
+		*stat* : aggregate statistic ("mean", "sum" or "count")
+
+		*selection* : file selection (see "select")
+
+		OUTPUTS:
+
+		*ukeys* : list of arrays, unique key combinations (one array per grouping variable)
+
+		*x* : array, aggregate statistic for each key combination
+		'''
+		entries   = self.select(**selection)
+		assert len(entries) > 0, 'No results files match the selection: %s' %selection
+		filelevel = ['dataset', 'filter'] + sorted( set(p  for e in entries  for p in e['params']) )
+		filekeys  = [s  for s in by  if s not in filelevel]
+		keys,sums,counts = [[] for s in by], [], []
+		for e in entries:
+			ukeys,s,c = self._partial(e, varname, filekeys)
+			for i,name in enumerate(by):
+				if name in filekeys:
+					keys[i].append( ukeys[filekeys.index(name)] )
+				else:
+					value = e[name] if name in ('dataset','filter') else e['params'][name]
+					keys[i].append( np.full(s.size, value) )
+			sums.append(s)
+			counts.append(c)
+		keys      = [np.hstack(k)  for k in keys]
+		ukeys,s   = groupby(keys, np.hstack(sums), stat='sum')
+		c         = groupby(keys, np.hstack(counts), stat='sum')[1]
+		if stat == 'sum':
+			return ukeys, s
+		elif stat == 'count':
+			return ukeys, c.astype(int)
+		elif stat == 'mean':
+			return ukeys, s / c
+		raise( ValueError('Unknown statistic: %s' %stat) )
+
+	def cache_clear(self):
+		self._cache = {}
+
+	def fpr(self, by=('sample_size','noise_amp'), **selection):
+		'''
+		False positive rate (%) on an N-dimensional grid of grouping variables
+
+		(Equivalent to:  100 * grid('h0reject', by, **selection) )
+		'''
+		levels,X  = self.grid('h0reject', by=by, **selection)
+		return levels, 100 * X
+
+	def grid(self, varname='h0reject', by=('sample_size','noise_amp'), stat='mean', **selection):
+		'''
+		Group-by aggregation (see "aggregate") reshaped into an N-dimensional grid
+
+		OUTPUTS:
+
+		*levels* : list of arrays, unique values of each grouping variable
+
+		*X* : N-dimensional array of aggregates, one dimension per grouping variable
+		'''
+		ukeys,x   = self.aggregate(varname, by=by, stat=stat, **selection)
+		return to_grid(ukeys, x)
+
+	def scan(self):
+		'''
+		(Re)index all results files in the results directory
+		'''
+		self.entries = []
+		for root,dirs,fnames in os.walk(self.dir0):
+			dirs[:]  = sorted( d for d in dirs if not d.startswith('.') )
+			for fname in sorted(fnames):
+				m    = _fname_pattern.match(fname)
+				if m is not None:
+					params = dict( (k,_parse_param(v))  for k,v in _param_pattern.findall(m.group(3)) )
+					self.entries.append( dict(dataset=int(m.group(1)), filter=int(m.group(2)), params=params, fname=os.path.join(root, fname)) )
+
+	def select(self, dataset=None, filter=None, **params):
+		'''
+		Select results files
+
+		Each selection argument can be a single value or a list of values. Files
+		are selected if they match all specified values.
+
+		Example:
+
+		>>> cat.select(dataset=0, filter=1, cutoff=[4,6], order=5)
+		'''
+		def _match(value, criterion):
+			if criterion is None:
+				return True
+			return (value in criterion) if isinstance(criterion, (list,tuple,np.ndarray)) else (value == criterion)
+		entries   = []
+		for e in self.entries:
+			if not ( _match(e['dataset'], dataset) and _match(e['filter'], filter) ):
+				continue
+			if all( (k in e['params']) and _match(e['params'][k], v)  for k,v in params.items() ):
+				entries.append(e)
+		return entries
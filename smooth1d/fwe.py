@@ -9,12 +9,14 @@ Procedures include:
 
 - bonferroni   (Bonferroni correction, assumes that data at adjacent time nodes are uncorrelated)
 
-- spm   (Statistical Parametric Mapping, asseses inter-node correlation and uses random field theory to compute FWE parametrically)
+- spm   (Statistical Parametric Mapping, asseses inter-node correlation and uses random field theory to compute FWE parametrically;  thresholds are cached, see smooth1d.rft)
 
-- snpm   (Statistical non-Parametric Mapping, asseses inter-node correlation implicitly through permutation-based test statistic distibution construction)
+- snpm   (Statistical non-Parametric Mapping, asseses inter-node correlation implicitly through permutation-based test statistic distibution construction;  uses a sign-flip permutation engine, see "sign_matrix")
 
 - uncorrected  (No multiple comparisons correction;  this will produce accurate FWE rates only if there is a single time node)
 
+All procedures accept either a single sample ( (J,Q) array ) or a stack of N samples ( (N,J,Q) array ), in which case results are (N,) arrays. Critical thresholds that depend only on (J, Q, alpha) are computed once and cached. The "inference" function applies any procedure and returns the rejection decision, maximum test statistic and critical threshold.
+
 References:
 
 - Friston, K. J., Ashburner, J. T., Kiebel, S. J., Nichols, T. E., Penny, W. D., 2007. Statistical Parametric Mapping: The Analysis of Functional Brain Images. London: Elsevier.
@@ -25,17 +27,135 @@ References:
 '''
 
 
+from functools import lru_cache
+import itertools
 import numpy as np
-from scipy import stats
-import spm1d
 
-from . import smooth
+from . import rft
 from . import util
 tstat = util.tstat
 
 
+snpm_max_permutations = 10000   #maximum number of sign-flip permutations (more are randomly sampled)
+snpm_block_size       = 2**22   #maximum number of permuted t values computed at once
+
+
+
+
+
+
+
+@lru_cache(maxsize=1024)
+def bonferroni_threshold(J, Q, alpha=0.05):
+	'''
+	Critical t value for the Bonferroni procedure
+	
+	*J* : sample size
+	
+	*Q* : number of continuum nodes
+	
+	*alpha* : Type I error rate
+	'''
+	from scipy import stats
+	pth  = 1 - (1-alpha)**(1/float(Q))
+	return float( stats.t.isf(pth, J-1) )
+
+
+@lru_cache(maxsize=1024)
+def uncorrected_threshold(J, alpha=0.05, two_tailed=True):
+	'''
+	Critical t value for uncorrected inference
+	
+	*J* : sample size
+	
+	*alpha* : Type I error rate
+	
+	*two_tailed* : whether or not two-tailed inference should be employed (bool)
+	'''
+	from scipy import stats
+	p    = 0.5 * alpha if two_tailed else alpha
+	return float( stats.t.isf(p, J-1) )
+
+
+
+def _prepare(y, y0):
+	'''
+	Intermediate statistics shared by all procedures:  deviations, t continua and maximum absolute t values
+	'''
+	d      = np.asarray(y - y0, dtype=float)
+	t      = tstat(d)
+	return dict(d=d, t=t, tmax=np.abs(t).max(axis=-1))
+
+
+def _bonferroni(s, alpha=0.05, two_tailed=True):
+	J,Q    = s['d'].shape[-2:]
+	tth    = bonferroni_threshold(J, Q, alpha)
+	return s['tmax'] > tth, np.full(s['tmax'].shape, tth)[()]
+
+
+def _snpm(s, alpha=0.05, two_tailed=True, iterations=-1, shared=True, seed=0):
+	d,t    = s['d'], s['t']
+	d,t    = (d[None], t[None]) if d.ndim==2 else (d, t)
+	N,J,Q  = d.shape
+	signs  = sign_matrix(J, iterations, seed)
+	rng    = None
+	if (not shared) and not ( (iterations == -1) and (2**J <= snpm_max_permutations) ):
+		rng    = np.random.default_rng(seed)   #one (P,J) sign matrix per sample, drawn block by block (see "_snpm_tmax")
+	elif two_tailed and (signs.shape[0] == 2**J):
+		signs  = signs[:2**(J-1)]   #|t| is unchanged by flipping all signs
+	ss     = (d**2).sum(axis=1)
+	Z      = _snpm_tmax(d, ss, signs, two_tailed, rng)
+	zstar  = np.percentile(Z, 100*(1-alpha), axis=-1, method='linear')
+	h0reject = ( np.abs(t).max(axis=-1) if two_tailed else t.max(axis=-1) ) > zstar
+	if s['d'].ndim == 2:
+		return h0reject[0], zstar[0]
+	return h0reject, zstar
+
+
+def _snpm_tmax(d, ss, signs, two_tailed=True, rng=None):
+	'''
+	Maximum permuted t values (or absolute t values if two_tailed) for deviations d ( (N,J,Q) )
+	with sum of squares ss ( (N,Q) ) and sign matrix signs ( (P,J) )
+	
+	If rng (a NumPy Generator) is given, the permutations are not shared:  each
+	sample has its own random (P,J) sign matrix (signs then gives only P), drawn
+	from rng one block of samples at a time, so memory use is bounded by
+	"snpm_block_size" (the draws do not depend on the block size).
+	
+	Returns an (N,P) array
+	'''
+	N,J,Q  = d.shape
+	P      = signs.shape[-2]
+	Z      = np.empty( (N, P) )
+	nb     = max(1, snpm_block_size // (P*Q))
+	for i in range(0, N, nb):
+		### permuted means (sign flips do not change the sum of squares):
+		di = d[i:i+nb]
+		n  = di.shape[0]
+		if rng is None:   #shared permutations:  a single (P,J) x (J,n*Q) matrix product
+			m  = ( signs @ di.transpose(1,0,2).reshape(J, n*Q) ).reshape(P, n, Q).transpose(1,0,2) / J
+		else:
+			si = 2.0 * rng.integers(0, 2, size=(n,P,J)) - 1
+			m  = np.matmul(si, di) / J
+		v  = ( ss[i:i+nb,None] - J*m**2 ) / (J - 1)
+		m  = np.abs(m) if two_tailed else m
+		Z[i:i+nb] = ( m / np.sqrt(v / J) ).max(axis=-1)
+	return Z
+
+
+def _spm(s, alpha=0.05, two_tailed=True):
+	d      = s['d']
+	J,Q    = d.shape[-2:]
+	fwhm   = util.estimate_fwhm( d - d.mean(axis=-2, keepdims=True) )
+	zstar  = rft.isf(alpha, J-1, Q, fwhm, two_tailed=two_tailed)
+	zz     = s['tmax'] if two_tailed else s['t'].max(axis=-1)
+	return zz > zstar, zstar
 
 
+def _uncorrected(s, alpha=0.05, two_tailed=True):
+	J      = s['d'].shape[-2]
+	tth    = uncorrected_threshold(J, alpha, two_tailed)
+	return s['tmax'] > tth, np.full(s['tmax'].shape, tth)[()]
 
 
 
@@ -47,7 +167,7 @@ def bonferroni(y, y0, alpha=0.05, two_tailed=True):
 	
 	Arguments:
 	
-	*y* : collection of J noisy 1D measurements ( (J,Q) NumPy array )
+	*y* : collection of J noisy 1D measurements ( (J,Q) or (N,J,Q) NumPy array )
 	
 	*y0* : datum continuum ( (Q,) NumPy array )
 	
@@ -55,55 +175,167 @@ def bonferroni(y, y0, alpha=0.05, two_tailed=True):
 	
 	*two_tailed* : whether or not two-tailed inference should be employed (bool)
 	'''
-	J,Q  = y.shape
-	p    = 0.5 * alpha if two_tailed else False
-	pth  = 1 - (1-alpha)**(1/float(Q))
-	tth  = stats.t.isf(pth, J-1)
-	t    = tstat(y - y0)
-	h0reject = np.abs(t).max() > tth
-	return h0reject
+	return _bonferroni(_prepare(y, y0), alpha, two_tailed)[0]
 
 
 
-def spm(y, y0, alpha=0.05, two_tailed=True):
+def inference(y, y0, procedure='spm', alpha=0.05, two_tailed=True):
 	'''
-	Statistical Parametric Mapping
+	Conduct inference using a specified FWE procedure
 	
-	Asseses inter-node correlation and uses random field theory to compute probabilities parametrically
+	Arguments:
+	
+	*y* : collection of J noisy 1D measurements ( (J,Q) NumPy array ), or a stack of N such collections ( (N,J,Q) NumPy array )
+	
+	*y0* : datum continuum ( (Q,) NumPy array )
+	
+	*procedure* : one of "bonferroni", "snpm", "spm", "uncorrected"
+	
+	*alpha* : Type I error rate
+	
+	*two_tailed* : whether or not two-tailed inference should be employed (bool)
+	
+	Outputs:
+	
+	*h0reject* : null hypothesis rejection decision (bool or (N,) array)
+	
+	*tmax* : maximum absolute t value (float or (N,) array)
+	
+	*zstar* : critical threshold (float or (N,) array)
+	'''
+	assert procedure in procedures, 'procedure must be one of: %s' %', '.join(sorted(procedures))
+	s      = _prepare(y, y0)
+	h0reject,zstar = procedures[procedure](s, alpha, two_tailed)
+	return h0reject, s['tmax'], zstar
+
+
+
+def multi_inference(y, y0, names=('spm',), alpha=0.05, two_tailed=True, callback=None):
+	'''
+	Conduct inference using multiple FWE procedures in one pass
+	
+	Intermediate statistics (deviations, t continua, maximum t values) are computed
+	only once and are shared by all procedures.
 	
 	Arguments:
 	
-	*y* : collection of J noisy 1D measurements ( (J,Q) NumPy array )
+	*y* : collection of J noisy 1D measurements ( (J,Q) NumPy array ), or a stack of N such collections ( (N,J,Q) NumPy array )
 	
 	*y0* : datum continuum ( (Q,) NumPy array )
 	
+	*names* : sequence of procedure names (see "inference")
+	
 	*alpha* : Type I error rate
 	
 	*two_tailed* : whether or not two-tailed inference should be employed (bool)
+	
+	*callback* : optional function called as callback(stage) after each stage: "tstat" (intermediate statistics), then each procedure name (e.g. for profiling)
+	
+	Outputs:
+	
+	*t* : t continuum ( (Q,) or (N,Q) array )
+	
+	*results* : dictionary of (h0reject, zstar) pairs, one for each procedure
+	'''
+	for name in names:
+		assert name in procedures, 'procedure must be one of: %s' %', '.join(sorted(procedures))
+	s      = _prepare(y, y0)
+	if callback is not None:
+		callback('tstat')
+	results = {}
+	for name in names:
+		results[name] = procedures[name](s, alpha, two_tailed)
+		if callback is not None:
+			callback(name)
+	return s['t'], results
+
+
+
+def sign_matrix(J, iterations=-1, seed=0):
+	'''
+	Sign-flip permutation matrix for one-sample permutation tests
+	
+	Arguments:
+	
+	*J* : sample size
+	
+	*iterations* : number of permutations (-1: all 2^J permutations if there are
+	no more than "snpm_max_permutations", otherwise "snpm_max_permutations" random permutations)
+	
+	*seed* : random number seed (used only for random permutations)
+	
+	Outputs:
+	
+	*signs* : (P,J) array of +1/-1 values (read-only;  matrices are cached)
 	'''
-	ti = spm1d.stats.ttest(y-y0).inference(alpha=alpha, two_tailed=two_tailed)
-	return ti.h0reject, np.abs(ti.z).max(), ti.zstar
+	return _sign_matrix(int(J), int(iterations), seed)
 
 
+@lru_cache(maxsize=64)
+def _sign_matrix(J, iterations, seed):
+	if (iterations == -1) and (2**J <= snpm_max_permutations):
+		signs = np.array( list( itertools.product((1,-1), repeat=J) ), dtype=float )
+	else:
+		P     = snpm_max_permutations if iterations==-1 else iterations
+		rng   = np.random.default_rng(seed)
+		signs = 2.0 * rng.integers(0, 2, size=(P,J)) - 1
+	signs.flags.writeable = False
+	return signs
 
-def snpm(y, y0, alpha=0.05, two_tailed=True):
+
+
+def snpm(y, y0, alpha=0.05, two_tailed=True, iterations=-1, shared=True, seed=0):
 	'''
 	Statistical non-Parametric Mapping
 	
 	Asseses inter-node correlation implicitly through permutation-based test statistic distibution construction
 	
+	The permutation distribution of the maximum t value is constructed from sign
+	flips of the deviations (y - y0). All permuted t continua are computed as a single
+	matrix product with a precomputed sign matrix (see "sign_matrix"), and are
+	equivalent to spm1d.stats.nonparam.ttest(y-y0).inference(alpha, two_tailed).
+	
 	Arguments:
 	
-	*y* : collection of J noisy 1D measurements ( (J,Q) NumPy array )
+	*y* : collection of J noisy 1D measurements ( (J,Q) or (N,J,Q) NumPy array )
 	
 	*y0* : datum continuum ( (Q,) NumPy array )
 	
 	*alpha* : Type I error rate
 	
 	*two_tailed* : whether or not two-tailed inference should be employed (bool)
+	
+	*iterations* : number of permutations (see "sign_matrix")
+	
+	*shared* : use the same random permutations for all N samples (bool;  if False each sample has its own permutations)
+	
+	*seed* : random number seed for random permutations
 	'''
-	ti = spm1d.stats.nonparam.ttest(y-y0).inference(alpha=alpha, two_tailed=two_tailed)
-	return ti.h0reject, np.abs(ti.z).max(), ti.zstar
+	s      = _prepare(y, y0)
+	h0reject,zstar = _snpm(s, alpha, two_tailed, iterations=iterations, shared=shared, seed=seed)
+	return h0reject, s['tmax'], zstar
+
+
+
+def spm(y, y0, alpha=0.05, two_tailed=True):
+	'''
+	Statistical Parametric Mapping
+	
+	Asseses inter-node correlation and uses random field theory to compute probabilities parametrically
+	
+	Arguments:
+	
+	*y* : collection of J noisy 1D measurements ( (J,Q) or (N,J,Q) NumPy array )
+	
+	*y0* : datum continuum ( (Q,) NumPy array )
+	
+	*alpha* : Type I error rate
+	
+	*two_tailed* : whether or not two-tailed inference should be employed (bool)
+	'''
+	s      = _prepare(y, y0)
+	h0reject,zstar = _spm(s, alpha, two_tailed)
+	return h0reject, s['tmax'], zstar
 
 
 
@@ -116,7 +348,7 @@ def uncorrected(y, y0, alpha=0.05, two_tailed=True):
 	
 	Arguments:
 	
-	*y* : collection of J noisy 1D measurements ( (J,Q) NumPy array )
+	*y* : collection of J noisy 1D measurements ( (J,Q) or (N,J,Q) NumPy array )
 	
 	*y0* : datum continuum ( (Q,) NumPy array )
 	
@@ -124,10 +356,8 @@ def uncorrected(y, y0, alpha=0.05, two_tailed=True):
 	
 	*two_tailed* : whether or not two-tailed inference should be employed (bool)
 	'''
-	J,Q  = y.shape
-	p    = 0.5 * alpha if two_tailed else False
-	tth  = stats.t.isf(p, J-1)
-	### t stat:
-	t    = tstat(y - y0)
-	h0reject = np.abs(t).max() > tth
-	return h0reject
+	return _uncorrected(_prepare(y, y0), alpha, two_tailed)[0]
+
+
+
+procedures = dict(bonferroni=_bonferroni, snpm=_snpm, spm=_spm, uncorrected=_uncorrected)
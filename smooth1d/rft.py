@@ -0,0 +1,123 @@
+'''
+rft.py
+
+Random field theory (RFT) critical thresholds for one-sample t continua.
+
+Simulations conduct millions of RFT inferences, but the critical threshold
+depends only on (alpha, degrees of freedom, number of nodes, smoothness).
+This module memoizes thresholds in a bounded LRU cache, with the smoothness
+(FWHM) quantized into narrow relative buckets so that draws with near-identical smoothness
+share a single threshold computation.
+
+The default bucket width (0.1% of the FWHM) changes critical thresholds
+by much less than the sampling variability of the FWHM estimate itself.
+
+Reference:
+
+- Pataky, T. C., 2016. rft1d: Smooth one-dimensional random field upcrossing probabilities in Python. Journal of Statistical Software 71, 1–22.
+'''
+
+
+from functools import lru_cache
+from math import exp,log,log1p
+import numpy as np
+
+
+fwhm_resolution = 0.001   #relative width of FWHM buckets
+cache_size      = 4096    #maximum number of cached thresholds (change using "set_cache_size")
+
+
+
+
+def fwhm_bucket(fwhm, resolution=None):
+	'''
+	Quantize an FWHM value into a (logarithmic) bucket index
+
+	INPUTS:
+
+	*fwhm* : smoothness estimate (float)
+
+	*resolution* : relative bucket width (float, default: module-level "fwhm_resolution")
+
+	OUTPUTS:
+
+	*k* : bucket index (int)
+	'''
+	resolution = fwhm_resolution if resolution is None else resolution
+	return int( round( log(fwhm) / log1p(resolution) ) )
+
+
+def _isf_resels(alpha, df, resels, withBonf, Q):
+	from spm1d import rft1d   #imported on first use (spm1d is slow to import)
+	return float( rft1d.t.isf_resels(alpha, df, resels, withBonf=withBonf, nNodes=Q) )
+
+
+def _isf_bucket_uncached(alpha, df, Q, k, resolution, withBonf):
+	fwhm   = exp( k * log1p(resolution) )
+	resels = 1, (Q - 1) / fwhm
+	return _isf_resels(alpha, df, resels, withBonf, Q)
+
+
+_isf_bucket = lru_cache(maxsize=cache_size)(_isf_bucket_uncached)
+
+
+def cache_clear():
+	'''
+	Clear the threshold cache
+	'''
+	_isf_bucket.cache_clear()
+
+
+def cache_info():
+	'''
+	Threshold cache statistics (hits, misses, maxsize, currsize)
+	'''
+	return _isf_bucket.cache_info()
+
+
+def set_cache_size(maxsize):
+	'''
+	Set the maximum number of cached thresholds
+
+	The cache is rebuilt, so all cached thresholds are discarded.
+
+	INPUTS:
+
+	*maxsize* : maximum number of cached thresholds (int, or None for an unbounded cache)
+	'''
+	global cache_size, _isf_bucket
+	assert (maxsize is None) or (int(maxsize) >= 0), 'maxsize must be a non-negative integer or None'
+	cache_size  = None if maxsize is None else int(maxsize)
+	_isf_bucket = lru_cache(maxsize=cache_size)(_isf_bucket_uncached)
+
+
+def isf(alpha, df, Q, fwhm, two_tailed=True, withBonf=True):
+	'''
+	Critical RFT threshold for a t continuum
+
+	INPUTS:
+
+	*alpha* : Type I error rate
+
+	*df* : degrees of freedom (int)
+
+	*Q* : number of continuum nodes (int)
+
+	*fwhm* : smoothness estimate (float or (N,) array)
+
+	*two_tailed* : whether or not two-tailed inference should be employed (bool)
+
+	*withBonf* : use a Bonferroni correction if less severe than the RFT correction (bool)
+
+	OUTPUTS:
+
+	*zstar* : critical threshold (float or (N,) array)
+	'''
+	a      = 0.5*alpha if two_tailed else alpha
+	if np.ndim(fwhm) > 0:
+		return np.array([isf(alpha, df, Q, w, two_tailed, withBonf)  for w in fwhm])
+	if not np.isfinite(fwhm):
+		resels = 1, (Q - 1) / fwhm
+		return _isf_resels(a, df, resels, withBonf, Q)
+	k      = fwhm_bucket(fwhm)
+	return _isf_bucket(float(a), int(df), int(Q), k, fwhm_resolution, bool(withBonf))
@@ -12,10 +12,15 @@ scripts directory mentioned above.
 
 
 import os
+import itertools
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import numpy as np
-import spm1d
 
 from . import datasets
+from . import fwe
 from . import smooth
 from . import util
 
@@ -24,43 +29,154 @@ from . import util
 
 
 class SimulationResults(object):
+	'''
+	Columnar simulation results store
+	
+	Records are kept in preallocated arrays (one per metric) which grow
+	geometrically. Records can be flushed incrementally to an on-disk store:
+	a directory of append-only NPZ shards, each containing the records added
+	since the previous flush. Shards are written atomically, so after a crash
+	all completed shards can be reloaded using "resume".
+	
+	Additional columns (e.g. one "h0reject" and "tstar" column for each
+	secondary inference procedure) can be added using "add_labels".
+	'''
 	def __init__(self):
 		self.n               = 0     #number of records
 		self.labels          = ['h0reject', 'tstar', 'tmax', 'dmax', 'rmse']  #main data labels
-		self.dmax            = []    #maximum difference (originnal units)
-		self.h0reject        = []    #significant difference detected?
-		self.rmse            = []    #root-mean square error
-		self.tmax            = []    #maximum absolute t value
-		self.tstar           = []    #critical (two-tailed) threshold
-		self.metadata        = []    #record labels
+		self.dtypes          = [bool, float, float, float, float]             #main data types
+		self.data            = None  #main data (dictionary of preallocated arrays)
+		self.metadata        = None  #record labels (preallocated array, one row per record)
 		self.metadata_labels = None  #metadata variable labels
 		self.metadata_types  = None  #metadata variable types
-		
+		self.nmetadata       = 0     #number of metadata records
+		self.nflushed        = 0     #number of records written to the on-disk store
+		self.nshards         = 0     #number of shards in the on-disk store
+		self.timings         = None  #optional per-stage timings (see Simulator.get_timings)
+		self._reserve(1024)
+	
+	def add_labels(self, labels, dtypes):
+		'''
+		Add data columns (must be called before any records are added)
+		'''
+		assert self.n == 0, 'Labels can only be added to empty results'
+		capacity  = self.data['rmse'].size
+		for s,typ in zip(labels, dtypes):
+			if s not in self.labels:
+				self.labels.append(s)
+				self.dtypes.append(typ)
+				self.data[s] = np.empty(capacity, dtype=typ)
 	
-	def append(self, rmse, h0reject, tstar, tmax, dmax):
-		self.dmax.append(dmax)
-		self.h0reject.append(h0reject)
-		self.rmse.append(rmse)
-		self.tmax.append(tmax)
-		self.tstar.append(tstar)
-		self.n += 1
+	def _reserve(self, n):
+		capacity  = 0 if self.data is None else self.data['rmse'].size
+		if n > capacity:
+			capacity  = max(n, 2*capacity)
+			data      = {s:np.empty(capacity, dtype=typ)  for s,typ in zip(self.labels, self.dtypes)}
+			if self.data is not None:
+				for s in self.labels:
+					data[s][:self.n] = self.data[s][:self.n]
+			self.data = data
+	
+	def _reserve_metadata(self, n, width):
+		if self.metadata is None:
+			self.metadata = np.empty( (max(n, 1024), width) )
+		elif n > self.metadata.shape[0]:
+			metadata  = np.empty( (max(n, 2*self.metadata.shape[0]), width) )
+			metadata[:self.nmetadata] = self.metadata[:self.nmetadata]
+			self.metadata = metadata
+	
+	def append(self, rmse, h0reject, tstar, tmax, dmax, **columns):
+		self.extend( [rmse], [h0reject], [tstar], [tmax], [dmax], **{s:[x]  for s,x in columns.items()} )
 	
 	def append_metadata(self, metadata):
-		self.metadata.append( metadata ) 
+		self.extend_metadata(metadata, 1)
+	
+	def extend(self, rmse, h0reject, tstar, tmax, dmax, **columns):
+		assert sorted(columns) == sorted(self.labels[5:]), 'Values must be specified for all additional columns: %s' %self.labels[5:]
+		n0,n = self.n, len(rmse)
+		self._reserve(n0 + n)
+		columns.update( h0reject=h0reject, tstar=tstar, tmax=tmax, dmax=dmax, rmse=rmse )
+		for s in self.labels:
+			self.data[s][n0:n0+n] = columns[s]
+		self.n += n
+	
+	def extend_metadata(self, metadata, n):
+		row    = np.asarray(metadata, dtype=float)
+		m      = self.nmetadata
+		self._reserve_metadata(m + n, row.size)
+		self.metadata[m:m+n] = row
+		self.nmetadata += n
+	
+	def flush(self, dirname, checkpoint=None):
+		'''
+		Append all records added since the previous flush to an on-disk store
+		
+		*dirname* : store directory (created if it does not exist)
+		
+		*checkpoint* : optional JSON-serializable dictionary, saved atomically with the records
+		'''
+		i0,i1  = self.nflushed, self.n
+		if (i1 == i0) and (checkpoint is None):
+			return
+		os.makedirs(dirname, exist_ok=True)
+		shard  = {s:self.data[s][i0:i1]  for s in self.labels}
+		if self.nmetadata > 0:
+			shard['metadata'] = self.metadata[i0:i1]
+		if checkpoint is not None:
+			shard['checkpoint'] = np.array( json.dumps(checkpoint) )
+		fname  = os.path.join(dirname, 'shard%06d.npz' %self.nshards)
+		with open(fname + '.tmp', 'wb') as f:
+			np.savez_compressed(f, **shard)
+		os.replace(fname + '.tmp', fname)
+		self.nflushed  = i1
+		self.nshards  += 1
 	
 	def get_metadata(self):
-		arrays = [np.asarray(x, dtype=typ)   for x,typ in zip(np.asarray(self.metadata).T,self.metadata_types)]
+		if self.nmetadata == 0:
+			return dict()
+		arrays = [np.asarray(x, dtype=typ)   for x,typ in zip(self.metadata[:self.nmetadata].T,self.metadata_types)]
 		return dict( zip(self.metadata_labels, arrays ) )
 	
 	def get_metrics(self):
-		data   = [self.h0reject, self.tstar, self.tmax, self.dmax, self.rmse]
-		return dict( zip(self.labels, data) )
+		return {s:self.data[s][:self.n]  for s in self.labels}
+	
+	def resume(self, dirname):
+		'''
+		Load all completed shards from an on-disk store (see "flush")
+		
+		Subsequent flushes append new shards to the same store.
+		
+		Returns the most recent checkpoint dictionary (or None)
+		'''
+		fnames = sorted( f for f in os.listdir(dirname) if f.startswith('shard') and f.endswith('.npz') )
+		checkpoint = None
+		for fname in fnames:
+			with np.load( os.path.join(dirname, fname) ) as Z:
+				if 'checkpoint' in Z.files:
+					checkpoint = json.loads( str(Z['checkpoint']) )
+				self.extend( Z['rmse'], Z['h0reject'], Z['tstar'], Z['tmax'], Z['dmax'], **{s:Z[s]  for s in self.labels[5:]} )
+				if 'metadata' in Z.files:
+					M = Z['metadata']
+					self._reserve_metadata(self.nmetadata + M.shape[0], M.shape[1])
+					self.metadata[self.nmetadata:self.nmetadata+M.shape[0]] = M
+					self.nmetadata += M.shape[0]
+		self.nflushed  = self.n
+		self.nshards   = len(fnames)
+		return checkpoint
 	
 	def save(self, filename):
 		results_dict  = self.get_metrics()
 		metadata_dict = self.get_metadata()
+		if self.timings is not None:
+			metadata_dict['timings'] = np.array( json.dumps(self.timings) )
 		np.savez_compressed(filename, **results_dict, **metadata_dict)
 	
+	def set_timings(self, timings):
+		'''
+		Attach per-stage timings (saved as a JSON string under the key "timings")
+		'''
+		self.timings = timings
+	
 	def set_metadata_labels(self, labels, types=None):
 		assert isinstance(labels, (tuple,list)), 'Metadata labels must be a tuple or list of strings'
 		for s in labels:
@@ -73,10 +189,96 @@ class SimulationResults(object):
 
 
 
+class FilterSpec(object):
+	'''
+	Filter registry entry (see "register_filter")
+	
+	*name* : filter name
+	
+	*fn* : filtering function:  fn(y, t, **params), where y is a (Q,) array
+	(or a (...,Q) array if batch is True) and t is the (Q,) time vector
+	
+	*params* : parameter schema:  sequence of (name, type) pairs, in the order used in
+	results filenames;  all parameters must be greater than zero
+	
+	*batch* : whether fn accepts (...,Q) arrays (otherwise it is applied row by row)
+	
+	*cache_outputs* : whether filtered samples may be stored on disk and reused
+	(see Simulator.set_filtered_cache_directory);  this requires fn to be
+	deterministic, with outputs that depend only on (y, t, params).  Filter
+	designs (operators, bases etc.) are cached separately by the smoothers
+	themselves (see smooth1d.smooth).
+	'''
+	def __init__(self, name, fn, params=(), batch=False, cache_outputs=True):
+		self.name          = name
+		self.fn            = fn
+		self.params        = tuple(params)
+		self.batch         = batch
+		self.cache_outputs = cache_outputs
+	
+	def __repr__(self):
+		return 'FilterSpec(%s, params=%s, batch=%s, cache_outputs=%s)' %(self.name, [s for s,typ in self.params], self.batch, self.cache_outputs)
+	
+	def check_params(self, params):
+		names      = [s for s,typ in self.params]
+		if len(names) == 0:
+			assert params in (None, {}), 'The "%s" filter has no parameters' %self.name
+			return
+		assert isinstance(params,dict) and (list(params.keys()) == names), 'params must be a dictionary containing keys: %s' %names
+		for s,typ in self.params:
+			x      = params[s]
+			assert isinstance(x, typ) and (x>0), 'params["%s"] must be of type %s and greater than zero' %(s, typ)
+
+
+def get_params_string(params):
+	'''
+	Filter parameter string used in results and cache filenames, e.g. "_cutoff2.5_order2"
+	
+	Values are represented exactly (integers and integral floats as integers,
+	other floats using repr) so that distinct parameter values yield distinct filenames.
+	'''
+	s           = ''
+	if params is not None:
+		for key,value in params.items():
+			value   = float(value)
+			s      += '_%s%s' %( key, ('%d' %value) if value.is_integer() else repr(value) )
+	return s
+
+
+filters = {}   #filter registry:  {name: FilterSpec}, in filter index order
+
+
+def register_filter(name, fn, params=(), batch=False, cache_outputs=True):
+	'''
+	Register a filter for use in simulations
+	
+	Filter indices (used in results filenames and seeds) follow registration order.
+	See FilterSpec for argument descriptions.
+	
+	Example:
+	
+	>>> register_filter('Median', lambda y,t,window: scipy.signal.medfilt(y, window), params=[('window',int)])
+	'''
+	assert name not in filters, 'A filter named "%s" is already registered' %name
+	filters[name] = FilterSpec(name, fn, params, batch, cache_outputs)
+	return filters[name]
+
+
+register_filter('None',        lambda y,t: y, batch=True)
+register_filter('Butterworth', lambda y,t,cutoff,order: smooth.butter_lowpass(y, t[1]-t[0], cutoff, order=order), params=[('cutoff',(int,float)), ('order',int)], batch=True)
+register_filter('Autocorr',    lambda y,t,order: smooth.autocorr(y, order=order, time=t), params=[('order',int)], batch=True)
+register_filter('GCVSPL',      lambda y,t,m: smooth.gcvspl(t, y, m=m), params=[('m',int)], batch=True)
+register_filter('SSA',         lambda y,t,window,ncomponents: smooth.ssa(y, window, ncomponents), params=[('window',int), ('ncomponents',int)], batch=True)
+register_filter('Wavelet',     lambda y,t: smooth.wavelet(y), batch=True)
+register_filter('Wiener',      lambda y,t,window: smooth.wiener(y, window=window), params=[('window',int)], batch=True)
+
+
+
+
 class Simulator(object):
 	def __init__(self):
 		self.dataset_names   = 'Vaughan1982', 'Challis1999a', 'Challis1999b', 'Challis1999c', 'Challis1999d', 'Challis1999e'
-		self.filter_names    = 'None', 'Butterworth', 'Autocorr', 'GCVSPL', 'SSA'
+		self.filter_names    = tuple(filters)
 		self.J               = None   #sample size (number of continuum observations)
 		self.Q               = None   #number of continuum nodes
 		self.alpha           = 0.05   #Type I error rate
@@ -84,23 +286,175 @@ class Simulator(object):
 		self.dt              = None   #duration between samples
 		self.filterfn        = None   #filtering function
 		self.filter_name     = None   #dataset name
+		self.filter_batch    = False  #whether filterfn accepts (... x Q) arrays
+		self.filter_cache_outputs = True  #whether filtered samples can be cached (see FilterSpec)
 		self.filter_params   = None   #filter parameter dictionary
+		self.filtered_cache_dir = None   #directory for memory-mapped filtered samples
+		self.inference       = ['spm']  #inference procedures (see smooth1d.fwe);  the first is the primary procedure
+		self.profile         = False  #record per-stage timings (see "get_timings")
+		self.timings         = {}     #per-stage cumulative times and call counts:  {stage: [seconds, calls]}
 		self.noise_amp       = None   #noise amplitude (in RMSE units)
 		self.noise_sd        = None   #noise amplitude (in SD units)
+		self.noise_block_size = 100   #iterations per random number substream
+		self.noise_counters  = {}     #iterations drawn for each (sample size, noise amplitude)
+		self.noise_cache_dir = None   #directory for memory-mapped (common) noise tensors
+		self._noise_cache    = {}     #open memory-mapped noise tensors
 		self.results_dir     = None   #directory to which results will be saved
+		self.rng             = None   #legacy random number generator (RandomState)
+		self.seedseq         = None   #root seed sequence for this dataset-filter pair (or dataset only, for common noise)
+		self.seed            = None   #random number seed
+		self.seed_common     = False  #whether noise is common to all filters
+		self._noise_stream   = None   #current substream:  (key, block, next iteration, generator)
 		self.t               = None   #time continuum
 		self.y0              = None   #dependent variable continuum
-		self.y               = None   #noisy sample (J x Q array)
-		self.ys              = None   #filtered sample (J x Q array)
+		self.y               = None   #noisy sample (J x Q array, or N x J x Q in batch mode)
+		self.ys              = None   #filtered sample (J x Q array, or N x J x Q in batch mode)
 		self.results         = SimulationResults()
 
 
 		
+	def _tic(self):
+		return time.perf_counter() if self.profile else None
+	
+	def _toc(self, stage, t0):
+		if t0 is not None:
+			t          = self.timings.setdefault(stage, [0.0, 0])
+			t[0]      += time.perf_counter() - t0
+			t[1]      += 1
+	
 	def filter(self):
-		self.ys        = np.array([self.filterfn(yy) for yy in self.y])
+		t0             = self._tic()
+		if self.filter_batch:
+			self.ys    = self.filterfn(self.y)
+		else:
+			y          = self.y.reshape(-1, self.Q)
+			self.ys    = np.array([self.filterfn(yy) for yy in y]).reshape(self.y.shape)
+		self._toc('filter', t0)
+	
+	def _get_noise_key(self):
+		return int(self.J), int( np.float64(self.noise_amp).view(np.uint64) )
+	
+	def _draw_noise(self, i0, n, out):
+		key            = self._get_noise_key()
+		B              = self.noise_block_size
+		i              = i0
+		while i < i0 + n:
+			k          = i // B
+			i1         = min( (k+1)*B, i0+n )
+			if (self._noise_stream is not None) and (self._noise_stream[:3] == (key, k, i)):
+				gen    = self._noise_stream[3]
+			else:
+				gen    = self.get_noise_stream(k)
+				if i > k*B:   #advance to iteration i
+					gen.standard_normal( size=(i-k*B, self.J, self.Q) )
+			gen.standard_normal( size=(i1-i, self.J, self.Q), out=out[i-i0:i1-i0] )
+			self._noise_stream = key, k, i1, gen
+			i          = i1
+	
+	def _get_cached_noise(self, n):
+		'''
+		Memory-mapped noise tensor with at least n iterations for the current sample size and noise amplitude
+		'''
+		key            = self._get_noise_key()
+		e              = self._noise_cache.get(key)
+		if (e is None) or (e.shape[0] < n):
+			fname      = self.get_noise_cache_filename()
+			if os.path.exists(fname):
+				e      = np.load(fname, mmap_mode='r')
+			if (e is None) or (e.shape[0] < n):
+				B      = self.noise_block_size
+				e      = np.empty( (-(-n // B) * B, self.J, self.Q) )
+				self._draw_noise(0, e.shape[0], e)
+				ftmp   = fname + '.%d.tmp' %os.getpid()
+				with open(ftmp, 'wb') as f:
+					np.save(f, e)
+				os.replace(ftmp, fname)
+				e      = np.load(fname, mmap_mode='r')
+			self._noise_cache[key] = e
+		return e
+	
+	def generate_noise(self, n):
+		'''
+		Standard normal noise for the next n iterations ( (n,J,Q) array )
+		
+		Iterations are grouped into blocks of "noise_block_size" iterations, and each
+		block has its own random number substream (see "get_noise_stream"), so noise
+		for any block can be regenerated independently. Noise does not depend on how
+		iterations are batched.
+		
+		If a noise cache directory is set (see "set_noise_cache_directory") noise is
+		read from a memory-mapped tensor that is generated only once.
+		'''
+		if (self.rng is None) and (self.seedseq is None):
+			self.set_seed()
+		if self.rng is not None:
+			return self.rng.randn(n, self.J, self.Q)
+		key            = self._get_noise_key()
+		i0             = self.noise_counters.get(key, 0)
+		if self.noise_cache_dir is not None:
+			e          = np.array( self._get_cached_noise(i0+n)[i0:i0+n] )
+		else:
+			e          = np.empty( (n, self.J, self.Q) )
+			self._draw_noise(i0, n, e)
+		self.noise_counters[key] = i0 + n
+		return e
 	
-	def generate_noisy_sample(self):
-		self.y         = self.y0 + self.noise_sd * np.random.randn(self.J, self.Q)
+	def generate_noisy_sample(self, n=None):
+		t0             = self._tic()
+		e              = self.generate_noise(1 if n is None else n)
+		e              = e[0] if n is None else e
+		self.y         = self.y0 + self.noise_sd * e
+		self._toc('noise', t0)
+	
+	def generate_filtered_samples(self, n, batch_size=None):
+		'''
+		Filtered samples for the next n iterations, generated in blocks of
+		batch_size iterations (default: all n at once)
+		
+		Yields one (b,J,Q) filtered sample array per block.
+		
+		If a filtered sample cache directory is set (see "set_filtered_cache_directory")
+		the n filtered samples are written to a memory-mapped .npy file the first time
+		they are generated, and are subsequently streamed from that file without
+		regenerating noise or refiltering.  This allows results to be reanalyzed
+		(e.g. with a different inference procedure) at the cost of reading the file.
+		'''
+		batch_size     = n if batch_size is None else batch_size
+		if (self.filtered_cache_dir is None) or (not self.filter_cache_outputs):
+			for i in range(0, n, batch_size):
+				self.generate_noisy_sample( min(batch_size, n-i) )
+				self.filter()
+				yield self.ys
+			return
+		assert self.rng is None, 'Filtered sample caching is not supported for legacy seeding'
+		if self.seedseq is None:
+			self.set_seed()
+		key            = self._get_noise_key()
+		i0             = self.noise_counters.get(key, 0)
+		fname          = self.get_filtered_cache_filename(i0, n)
+		if os.path.exists(fname):
+			ys         = np.load(fname, mmap_mode='r')
+			self.y     = None
+			for i in range(0, n, batch_size):
+				t0      = self._tic()
+				self.ys = np.array( ys[i:i+batch_size] )
+				self._toc('cache', t0)
+				yield self.ys
+			self.noise_counters[key] = i0 + n
+			self._noise_stream       = None
+			return
+		ftmp           = fname + '.%d.tmp' %os.getpid()
+		ys             = np.lib.format.open_memmap(ftmp, mode='w+', shape=(n, self.J, self.Q))
+		for i in range(0, n, batch_size):
+			self.generate_noisy_sample( min(batch_size, n-i) )
+			self.filter()
+			t0         = self._tic()
+			ys[i:i+self.ys.shape[0]] = self.ys
+			self._toc('cache', t0)
+			yield self.ys
+		ys.flush()
+		del ys
+		os.replace(ftmp, fname)
 
 	def get_dataset(self):
 		return self.t, self.y0
@@ -108,26 +462,88 @@ class Simulator(object):
 		return self.dataset_names.index(self.dataset_name)
 	def get_filter_index(self):
 		return self.filter_names.index(self.filter_name)
+	def get_filtered_cache_filename(self, i0, n):
+		'''
+		Filtered sample cache file for iterations i0 to (i0+n-1) at the current sample size and noise amplitude
+		
+		The filename identifies the noise (seed, noise block size, sample size and
+		amplitude) and the filter (index and exact parameter values).
+		'''
+		fname       = 'filtered_dataset%d_seed%d_block%d' %(self.get_dataset_index(), self.seed, self.noise_block_size)
+		fname      += '_common' if self.seed_common else ''
+		fname      += '_J%d_amp%r_filter%d' %(self.J, float(self.noise_amp), self.get_filter_index())
+		fname      += self.get_filter_params_string()
+		fname      += '_iter%d-%d.npy' %(i0, i0+n)
+		return os.path.join(self.filtered_cache_dir, fname)
+	def get_filter_params_string(self):
+		return get_params_string(self.filter_params)
 	def get_filtered_sample(self):
 		return self.t, self.ys
 	def get_noisy_sample(self):
 		return self.t, self.y
 	def get_metadata(self):
 		return self.results.get_metadata()
+	def get_noise_cache_filename(self):
+		fname       = 'noise_dataset%d_seed%d_block%d_J%d_amp%r' %(self.get_dataset_index(), self.seed, self.noise_block_size, self.J, float(self.noise_amp))
+		if not self.seed_common:
+			fname  += '_filter%d' %self.get_filter_index()
+		return os.path.join(self.noise_cache_dir, fname + '.npy')
+	def get_noise_stream(self, block):
+		'''
+		Random number generator (PCG64) for one block of iterations at the current
+		sample size and noise amplitude
+		'''
+		ss          = np.random.SeedSequence( self.seedseq.entropy, spawn_key=self.seedseq.spawn_key + self._get_noise_key() + (block,) )
+		return np.random.Generator( np.random.PCG64(ss) )
 	def get_results(self):
 		return self.results
+	def get_timings(self):
+		'''
+		Per-stage cumulative times (s) and call counts, recorded when profiling is enabled (see "set_profile")
+		
+		Stages:  "noise" (noise generation), "filter", "cache" (filtered sample cache reads/writes),
+		"tstat" (t continua), "inference_NAME" (one per inference procedure) and "results" (bookkeeping)
+		'''
+		return {stage:dict(time=t, calls=c)  for stage,(t,c) in self.timings.items()}
+	def get_results_shards_directory(self):
+		return os.path.splitext( self.get_results_filename() )[0] + '_shards'
 	def get_results_filename(self):
 		ind_filter  = self.get_filter_index()
 		ind_dataset = self.get_dataset_index()
 		fname       = 'dataset%d' %ind_dataset
 		fname      += '_filter%d' %ind_filter
-		if self.filter_params is not None:
-			for key,value in self.filter_params.items():
-				fname  += '_%s%d' %(key,value)
+		fname      += self.get_filter_params_string()
 		fname      += '.npz'
 		fname       = os.path.join(self.results_dir, fname)
 		return fname
 	
+	def flush(self, checkpoint=None):
+		self.get_results().flush( self.get_results_shards_directory(), checkpoint=checkpoint )
+	
+	def get_rng_state(self):
+		if self.rng is not None:
+			name,keys,pos,has_gauss,cached_gaussian = self.rng.get_state()
+			return ['legacy', [name, keys.tolist(), int(pos), int(has_gauss), float(cached_gaussian)]]
+		return ['counters', [[J, amp, n]  for (J,amp),n in self.noise_counters.items()]]
+	
+	def remove_shards(self):
+		'''
+		Delete all flushed results (see "flush") for the current dataset, filter and filter parameters
+		'''
+		dir0        = self.get_results_shards_directory()
+		if os.path.isdir(dir0):
+			for fname in os.listdir(dir0):
+				if fname.startswith('shard'):
+					os.remove( os.path.join(dir0, fname) )
+	
+	def resume(self):
+		'''
+		Reload flushed results (see "flush") and return the most recent checkpoint (or None)
+		'''
+		dir0        = self.get_results_shards_directory()
+		if os.path.isdir(dir0):
+			return self.get_results().resume(dir0)
+	
 	def save(self):
 		results     = self.get_results()
 		fnameNPZ    = self.get_results_filename()
@@ -147,48 +563,104 @@ class Simulator(object):
 		self.y0           = y0
 
 	def set_filter(self, name, params=None):
+		'''
+		Set the filter (see "register_filter") and its parameters
+		'''
+		self.filter_names     = tuple(filters)
 		assert (name in self.filter_names), 'The specified filter name ("%s") must be one of: %s' %(name, self.filter_names)
+		spec                  = filters[name]
+		spec.check_params(params)
 		self.filter_name      = name
 		self.filter_params    = params
-		if name is 'None':
-			self.filterfn     = lambda x: x
-		elif name is 'Butterworth':
-			assert isinstance(params,dict) and (list(params.keys()) == ['cutoff', 'order']), 'params must be a dictionary containing "cutoff" and "order" keys'
-			cutoff            = params['cutoff']
-			order             = params['order']
-			assert isinstance(cutoff, (int,float)) and (cutoff>0), 'params["cutoff"] must be an integer or float greater than zero'
-			assert isinstance(order, int) and (order>0), 'params["order"] must be an integer greater than zero'
-			self.filterfn     = lambda x: smooth.butter_lowpass(x, self.dt, cutoff, order=order)
-		elif name is 'Autocorr':
-			assert isinstance(params,dict) and (list(params.keys()) == ['order']), 'params must be a dictionary containing an "order" key'
-			order             = params['order']
-			assert isinstance(order, int) and (order>0), 'params["order"] must be an integer greater than zero'
-			self.filterfn     = lambda x: smooth.autocorr(x, order=order, time=self.t)
-		elif name is 'GCVSPL':
-			assert isinstance(params,dict) and (list(params.keys()) == ['m']), 'params must be a dictionary containing an "m" (half-order) key'
-			m                 = params['m']
-			assert isinstance(m, int) and (m>0), 'params["m"] must be an integer greater than zero'
-			self.filterfn     = lambda x: smooth.gcvspl(self.t, x, m=m)
-		elif name is 'SSA':
-			assert isinstance(params,dict) and (list(params.keys()) == ['window','ncomponents']), 'params must be a dictionary containing an "order" key'
-			window            = params['window']
-			ncomponents       = params['ncomponents']
-			assert isinstance(window, int) and (window>0), 'params["window"] must be an integer greater than zero'
-			assert isinstance(ncomponents, int) and (ncomponents>0), 'params["ncomponents"] must be an integer greater than zero'
-			self.filterfn     = lambda x: smooth.ssa(x, window, ncomponents)
+		self.filter_batch     = spec.batch
+		self.filter_cache_outputs = spec.cache_outputs
+		kwargs                = {} if params is None else dict(params)
+		self.filterfn         = lambda x: spec.fn(x, self.t, **kwargs)
+	
+	def set_inference(self, procedures):
+		'''
+		Set the inference procedures (see smooth1d.fwe.procedures)
+		
+		Results for the first (primary) procedure are saved as "h0reject" and "tstar".
+		Results for all other procedures are saved as "h0reject_NAME" and "tstar_NAME".
+		
+		Example:
+		
+		>>> sim.set_inference( ['spm', 'snpm', 'bonferroni'] )
+		'''
+		assert isinstance(procedures, (list,tuple)) and (len(procedures)>0), 'procedures must be a non-empty list'
+		for name in procedures:
+			assert name in fwe.procedures, 'Each procedure must be one of: %s' %', '.join(sorted(fwe.procedures))
+		self.inference = list(procedures)
+		labels         = [s %name  for name in procedures[1:]  for s in ('h0reject_%s', 'tstar_%s')]
+		self.results.add_labels(labels, [bool, float] * (len(procedures)-1))
 	
 	def set_metadata_labels(self, labels, types=None):
 		self.results.set_metadata_labels(labels, types=types)
 
-	def set_seed(self):
+	def reset_timings(self):
+		self.timings = {}
+	
+	def set_filtered_cache_directory(self, dir0):
+		assert os.path.isdir(dir0), "Filtered sample cache directory must be an existing directory"
+		self.filtered_cache_dir = dir0
+	
+	def set_noise_cache_directory(self, dir0):
+		assert os.path.isdir(dir0), "Noise cache directory must be an existing directory"
+		self.noise_cache_dir = dir0
+		self._noise_cache    = {}
+	
+	def set_seed(self, seed=0, legacy=False, common=False):
+		'''
+		Seed this Simulator's random number generators
+		
+		Noise is drawn from substreams of a seed sequence that is unique to
+		(seed, dataset, filter), and to each (sample size, noise amplitude,
+		iteration block);  see "get_noise_stream".
+		
+		If common is True the seed sequence is unique to (seed, dataset) only,
+		so all filters and filter parameters receive the same noise realizations
+		(common random numbers).
+		
+		If legacy is True the original seeding is used:  a single Mersenne Twister
+		stream seeded with (filter index + dataset index), as used to generate the
+		published results. (In this case "seed" is ignored.)
+		'''
 		ind_filter  = self.get_filter_index()
 		ind_dataset = self.get_dataset_index()
-		np.random.seed(ind_filter+ind_dataset)
+		if legacy:
+			assert not common, 'Common noise is not supported for legacy seeding'
+			self.rng     = np.random.RandomState(ind_filter+ind_dataset)
+			self.seedseq = None
+		else:
+			key          = (ind_dataset,) if common else (ind_dataset, ind_filter)
+			self.rng     = None
+			self.seedseq = np.random.SeedSequence(seed, spawn_key=key)
+		self.seed           = seed
+		self.seed_common    = common
+		self.noise_counters = {}
+		self._noise_cache   = {}
+		self._noise_stream  = None
 	
 	def set_results_directory(self, dir0):
 		assert os.path.isdir(dir0), "Results directory must be an existing directory"
 		self.results_dir = dir0
 	
+	def set_profile(self, profile=True):
+		'''
+		Enable (or disable) per-stage timing (see "get_timings")
+		'''
+		self.profile = bool(profile)
+	
+	def set_rng_state(self, state):
+		kind,state  = state
+		if kind == 'legacy':
+			name,keys,pos,has_gauss,cached_gaussian = state
+			self.rng.set_state( (name, np.asarray(keys, dtype=np.uint32), pos, has_gauss, cached_gaussian) )
+		else:
+			self.noise_counters = {(J,amp):n  for J,amp,n in state}
+			self._noise_stream  = None
+	
 	def set_noise_amp(self, amp):
 		assert isinstance(amp, (float,int)), 'Noise ampltiude must be a float or an integer'
 		self.noise_amp = amp
@@ -199,22 +671,237 @@ class Simulator(object):
 		assert (isinstance(J, int) and (J>0)), 'Sample size must be an integer' %(amp)
 		self.J         = J
 
-	def simulate(self, n_iterations, metadata=None):
+	def simulate(self, n_iterations, metadata=None, batch_size=None):
+		'''
+		Simulate n_iterations iterations, in batches of batch_size iterations (default: 1)
+		'''
 		assert (isinstance(n_iterations, int) and (n_iterations>0)), 'n_iterations must be an integer greater than zero'
-		for i in range(n_iterations):
-			self.generate_noisy_sample()
-			self.filter()
-			t,y           = self.get_filtered_sample()
-			rmse          = util.prmse(self.y0, y).mean()
-			spmi          = spm1d.stats.ttest(y-self.y0).inference(alpha=self.alpha, two_tailed=True)
-			h0reject      = spmi.h0reject
-			tmax          = np.abs( spmi.z ).max()
-			tstar         = spmi.zstar
-			ind           = np.abs( spmi.z ).argmax()
-			dmax          = y[:,ind].mean() - self.y0[ind]
-			self.results.append( rmse, h0reject, tstar, tmax, dmax )
-			if metadata is not None:
-				self.results.append_metadata(metadata)
+		batch_size        = 1 if batch_size is None else batch_size
+		assert (isinstance(batch_size, int) and (batch_size>0)), 'batch_size must be an integer greater than zero'
+		for ys in self.generate_filtered_samples(n_iterations, batch_size):
+			self.analyze_batch(ys, metadata=metadata)
+
+	def analyze_batch(self, y, metadata=None):
+		'''
+		Conduct inference on an (n x J x Q) filtered sample and append the results
+		
+		All inference procedures (see "set_inference") are computed in one pass,
+		from the same t continua.
+		'''
+		t0            = [self._tic()]
+		def callback(stage):   #time each stage of multi_inference
+			self._toc(stage if stage=='tstat' else 'inference_%s' %stage, t0[0])
+			t0[0]     = self._tic()
+		z,results     = fwe.multi_inference(y, self.y0, self.inference, self.alpha, True, callback=callback)
+		t0            = self._tic()
+		n             = y.shape[0]
+		rmse          = util.prmse(self.y0, y).mean(axis=-1)
+		tmax          = np.abs(z).max(axis=1)
+		ind           = np.abs(z).argmax(axis=1)
+		dmax          = y[np.arange(n),:,ind].mean(axis=1) - self.y0[ind]
+		h0reject,tstar = results[ self.inference[0] ]
+		columns       = {}
+		for name in self.inference[1:]:
+			columns['h0reject_%s' %name], columns['tstar_%s' %name] = results[name]
+		self.results.extend( rmse, h0reject, tstar, tmax, dmax, **columns )
+		if metadata is not None:
+			self.results.extend_metadata(metadata, n)
+		self._toc('results', t0)
+
 
 
 
+def _simulate_cell(sweep, cell):
+	dataset_name,params = cell
+	sim       = sweep.get_simulator(dataset_name, params)
+	blocks    = [[J, amp]  for J in sweep.sample_sizes  for amp in sweep.noise_amps]
+	config    = dict(filter_name=sweep.filter_name, params=params, alpha=sweep.alpha, batch_size=sweep.batch_size, blocks=blocks, n_iterations=sweep.n_iterations, seed=sweep.seed, seed_legacy=sweep.seed_legacy, common_noise=sweep.common_noise, inference=sweep.inference)
+	checkpoint = None
+	if sweep.results_dir is not None:
+		if sweep.resume:
+			checkpoint = sim.resume()
+		else:   #start afresh:  stale shards would otherwise be reloaded by a later resume
+			sim.remove_shards()
+	if checkpoint is None:
+		nblocks   = 0
+	else:
+		assert checkpoint['config'] == config, 'Cannot resume: simulation settings differ from those in %s' %sim.get_results_shards_directory()
+		nblocks   = checkpoint['block'] + 1
+		sim.set_rng_state( checkpoint['rng_state'] )
+		if sweep.verbose:
+			print('%s:  Dataset=%d, Params=%s, resuming after %d of %d blocks' %(sim.filter_name, sim.get_dataset_index(), params, nblocks, len(blocks)))
+	for i,(J,amp) in enumerate(blocks):
+		if i < nblocks:   #completed before a previous run was interrupted
+			continue
+		if sweep.verbose:
+			print('%s:  Dataset=%d, Params=%s, J=%d, Noise=%.2f' %(sim.filter_name, sim.get_dataset_index(), params, J, amp))
+		sim.set_sample_size( J )
+		sim.set_noise_amp( amp )
+		sim.simulate(sweep.n_iterations, metadata=[J, amp], batch_size=sweep.batch_size)
+		if sweep.profile and sweep.verbose:
+			timings = sim.get_timings()
+			total   = sum( t['time']  for t in timings.values() )
+			print( '    timings:  ' + ',  '.join( '%s %.2f s (%.0f%%)' %(stage, t['time'], 100*t['time']/total)  for stage,t in timings.items() ) )
+		if sweep.results_dir is not None:
+			sim.flush( checkpoint=dict(block=i, config=config, rng_state=sim.get_rng_state()) )
+	if sweep.profile:
+		sim.get_results().set_timings( sim.get_timings() )
+	if (sweep.results_dir is not None) and ( (nblocks < len(blocks)) or not os.path.exists(sim.get_results_filename()) ):
+		sim.save()
+	return sim.get_results()
+
+
+
+class Sweep(object):
+	'''
+	Declarative parameter sweep:  datasets x filter parameters x sample sizes x noise amplitudes
+	
+	Each cell (one dataset and one filter parameter combination) is simulated by
+	its own Simulator, seeded using Simulator.set_seed, with sample sizes and
+	noise amplitudes simulated in order. Cells are independent, so they can be
+	distributed over a process pool, and each cell's results are identical
+	to those of a serial run.
+	
+	If a results directory is set, each (sample size, noise amplitude) block
+	is flushed to disk together with a checkpoint (block index and random
+	number generator state). An interrupted sweep can then be restarted:
+	completed blocks and cells are skipped, and results are bit-identical
+	to those of an uninterrupted run.
+	
+	Iterations are simulated in batches (see "set_batch_size"):  noise, filtering
+	and inference are vectorized across the iterations of a batch, and results
+	are identical to those of serial iterations.
+	
+	With common random numbers (see "set_common_noise") every filter and
+	filter parameter combination receives the same noise realizations, so
+	differences between filters are not confounded by sampling variability.
+	
+	Example:
+	
+	>>> sweep = smooth1d.sim.Sweep('Butterworth', params=dict(cutoff=[2,4,6], order=[2,3]))
+	>>> sweep.set_results_directory( '/my/results/' )
+	>>> results = sweep.run(nprocs=8)
+	'''
+	def __init__(self, filter_name, params=None, dataset_names=None, sample_sizes=None, noise_amps=None, n_iterations=1000):
+		self.alpha         = 0.05   #Type I error rate
+		self.batch_size    = 100    #iterations per batch (None = serial iterations;  results do not depend on the batch size)
+		self.dataset_names = ['Challis1999e'] if dataset_names is None else list(dataset_names)
+		self.filter_name   = filter_name
+		self.n_iterations  = n_iterations
+		self.noise_amps    = [0.01, 0.20] if noise_amps is None else list(noise_amps)
+		self.params        = params  #filter parameter grid (dictionary of lists)
+		self.results_dir   = None   #directory to which results will be saved
+		self.resume        = True   #resume from checkpoints in results_dir (if any);  if False, existing checkpoints are deleted
+		self.seed          = 0      #random number seed (see Simulator.set_seed)
+		self.seed_legacy   = False  #use the original (legacy) seeding
+		self.common_noise  = False  #use the same noise realizations for all filters and parameters
+		self.noise_cache   = None   #directory for memory-mapped noise tensors
+		self.filtered_cache = None  #directory for memory-mapped filtered samples
+		self.inference     = ['spm']  #inference procedures (see Simulator.set_inference)
+		self.profile       = False  #record per-stage timings for each cell (see Simulator.get_timings)
+		self.sample_sizes  = [5, 6, 7, 8, 9, 10, 15, 20, 25, 30, 35, 45, 50] if sample_sizes is None else list(sample_sizes)
+		self.verbose       = False
+	
+	def get_cells(self):
+		if self.params is None:
+			plist = [None]
+		else:
+			keys  = list(self.params.keys())
+			plist = [dict(zip(keys, values))  for values in itertools.product(*self.params.values())]
+		return [(name, p)  for name in self.dataset_names  for p in plist]
+	
+	def get_simulator(self, dataset_name, params=None):
+		sim    = Simulator()
+		sim.set_alpha(self.alpha)
+		sim.set_dataset_name(dataset_name)
+		sim.set_filter(self.filter_name, params=params)
+		sim.set_inference(self.inference)
+		sim.set_profile(self.profile)
+		sim.set_metadata_labels(['sample_size','noise_amp'], types=[int,float])
+		if self.results_dir is not None:
+			sim.set_results_directory(self.results_dir)
+		sim.set_seed(self.seed, legacy=self.seed_legacy, common=self.common_noise)
+		if self.noise_cache is not None:
+			sim.set_noise_cache_directory(self.noise_cache)
+		if self.filtered_cache is not None:
+			sim.set_filtered_cache_directory(self.filtered_cache)
+		return sim
+	
+	def run(self, nprocs=None):
+		'''
+		Simulate all cells, optionally saving each cell's results.
+		
+		*nprocs* : number of worker processes (default: os.cpu_count();  1 = run in this process)
+
+		Each process keeps its own cache of Butterworth filter operators, of at
+		most smooth.butter_matrix_cache_bytes (default 64 MB), so a sweep can use
+		up to nprocs times this much memory for operators. To lower the limit,
+		set smooth.butter_matrix_cache_bytes before calling "run" (workers that
+		are not forked, e.g. on Windows and macOS, do not inherit the setting).
+
+		Returns a list of SimulationResults objects (one per cell, in "get_cells" order)
+		'''
+		cells  = self.get_cells()
+		keys   = [(name, get_params_string(p))  for name,p in cells]
+		assert len(set(keys)) == len(keys), 'Each cell must have unique filter parameters (cells would share results files)'
+		fn     = partial(_simulate_cell, self)
+		nprocs = os.cpu_count() if nprocs is None else nprocs
+		if (nprocs == 1) or (len(cells) == 1):
+			return [fn(cell) for cell in cells]
+		with ProcessPoolExecutor(max_workers=min(nprocs, len(cells))) as executor:
+			return list( executor.map(fn, cells) )
+	
+	def set_alpha(self, alpha):
+		assert (isinstance(alpha, float) and (alpha>0) and (alpha<1)), 'alpha must be a float between 0 and 1'
+		self.alpha     = alpha
+	
+	def set_batch_size(self, batch_size):
+		'''
+		Set the number of iterations per batch (default: 100;  None = serial iterations)
+		
+		Larger batches reduce per-iteration overhead but increase memory use
+		per worker process (approximately batch_size x J x Q values per array).
+		'''
+		assert (batch_size is None) or (isinstance(batch_size, int) and (batch_size>0)), 'batch_size must be None or an integer greater than zero'
+		self.batch_size = batch_size
+	
+	def set_common_noise(self, common=True, cache_dir=None):
+		'''
+		Use common random numbers:  the same noise realizations for all filters and parameters
+		
+		*cache_dir* : optional directory in which noise tensors are generated once
+		(per dataset, sample size and noise amplitude) and then shared (memory-mapped)
+		by all cells and worker processes
+		'''
+		assert (cache_dir is None) or os.path.isdir(cache_dir), "Noise cache directory must be an existing directory"
+		self.common_noise  = common
+		self.noise_cache   = cache_dir
+	
+	def set_filtered_cache_directory(self, dir0):
+		'''
+		Cache filtered samples in a directory (see Simulator.generate_filtered_samples)
+		
+		Rerunning the sweep (e.g. after changing alpha) then skips noise generation and filtering.
+		'''
+		assert (dir0 is None) or os.path.isdir(dir0), "Filtered sample cache directory must be an existing directory"
+		self.filtered_cache = dir0
+	
+	def set_inference(self, procedures):
+		'''
+		Set the inference procedures (see Simulator.set_inference)
+		'''
+		assert isinstance(procedures, (list,tuple)) and (len(procedures)>0), 'procedures must be a non-empty list'
+		self.inference = list(procedures)
+	
+	def set_profile(self, profile=True):
+		'''
+		Record per-stage timings for each cell (see Simulator.get_timings)
+		
+		Timings are attached to each cell's results (SimulationResults.timings)
+		and, if verbose, printed after each (sample size, noise amplitude) block.
+		'''
+		self.profile = bool(profile)
+	
+	def set_results_directory(self, dir0):
+		assert os.path.isdir(dir0), "Results directory must be an existing directory"
+		self.results_dir = dir0
@@ -9,20 +9,37 @@ Currently implemented algorithms include:
 
 - butter_lowpass : low-pass Butterworth filter
 
+- ButterworthStream : streaming (causal or fixed-lag) low-pass Butterworth filter
+
 - gcvspl : generalized cross-validatory spline filter
 
 - ssa : singular Spectrum Analysis smoother
 
+- ssa_windowed : blockwise (linear-time) singular Spectrum Analysis smoother for long signals
+
+- wavelet : wavelet denoiser (soft thresholding)
+
+- wiener : Wiener filter
+
+All smoothers accept arrays of arbitrary shape, filtered along the time axis
+specified by the "axis" argument (default: the last axis).  Channels (all
+other dimensions) can also be split across threads using the "workers"
+argument;  this is useful for many channels, as the underlying kernels
+(scipy.signal, pywt, LAPACK/BLAS) release the GIL.
+
 '''
 
 
-import os
-import ctypes
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from math import sqrt,log
+import os
+import threading
 import numpy as np
+import scipy.fft
+import scipy.linalg
 import scipy.signal
-from statsmodels.robust import mad
-import pywt
 
 
 from . import util
@@ -32,13 +49,116 @@ paddoff         = util.paddoff
 
 
 
-def butter_lowpass(y, dt, cutoff, order=2):
+def _channels(fn, y, axis=-1, workers=1):
+	'''
+	Apply a smoother along one axis of an array of arbitrary shape
+
+	*fn* : smoother acting along the last axis of (n,Q) arrays, returning (n,...) arrays
+
+	*y* : measurements (array of arbitrary shape)
+
+	*axis* : time (continuum) axis of y
+
+	*workers* : number of threads (-1 = all CPUs);  channels (all rows except
+	the time axis) are split into one block per thread
+
+	Returns fn's output for y with the time axis moved to the end:  (...,Q) or (...,*extra)
+	'''
+	y         = np.moveaxis( np.asarray(y, dtype=float), axis, -1 )
+	workers   = os.cpu_count() if workers == -1 else workers
+	assert isinstance(workers, int) and (workers >= 1), 'workers must be a positive integer or -1'
+	if (y.ndim == 1) or (workers == 1):
+		return fn(y)
+	yy        = y.reshape(-1, y.shape[-1])
+	blocks    = np.array_split(yy, min(workers, yy.shape[0]))
+	with ThreadPoolExecutor(len(blocks)) as executor:
+		ys    = np.concatenate( list( executor.map(fn, blocks) ) )
+	return ys.reshape( y.shape[:-1] + ys.shape[1:] )
+
+
+
+@lru_cache(maxsize=256)
+def _butter_sos(order, wn):
+	'''
+	Cached Butterworth design (second-order sections)
+	
+	*wn* : cut-off frequency, normalized by the Nyquist frequency
+	'''
+	return scipy.signal.butter(order, wn, btype='lowpass', output='sos')
+
+
+_butter_matrix_max_nodes  = 256   #maximum continuum size for (Q,Q) filter operators
+butter_matrix_cache_bytes = 2**26   #maximum total size of cached (Q,Q) filter operators, per process (64 MB;  see "_butter_matrix")
+_butter_matrices          = OrderedDict()   #LRU cache:  {(order,wn,Q): operator, or None if requested but not yet built}
+_butter_matrices_lock     = threading.Lock()
+
+
+def _butter_matrix(order, wn, Q, defer=False):
+	'''
+	Cached (Q,Q) linear operator equivalent to zero-phase filtering with odd padding
+	
+	Row i is the filtered i-th unit impulse, so filtered data are:  ys = y @ M
+	
+	Building an operator costs as much as filtering Q rows. If defer is True an
+	operator is built only when it is requested for the second time (None is
+	returned for the first request), so that operators are only built for
+	cut-offs that are reused.
+	
+	The least recently used operators are evicted when the total size of the
+	cache (each entry counted as a (Q,Q) operator) exceeds
+	"butter_matrix_cache_bytes". The cache is per process, so a parameter
+	sweep uses up to nprocs times this limit (see sim.Sweep.run).
+	'''
+	key       = order, wn, Q
+	with _butter_matrices_lock:
+		if key in _butter_matrices:
+			_butter_matrices.move_to_end(key)
+			M = _butter_matrices[key]
+			if M is not None:
+				return M
+		elif defer:
+			_butter_matrices[key] = None
+			_butter_matrix_evict()
+			return None
+	M         = scipy.signal.sosfiltfilt(_butter_sos(order, wn), np.eye(Q), axis=-1, padtype='odd')
+	M.flags.writeable = False
+	with _butter_matrices_lock:
+		_butter_matrices[key] = M
+		_butter_matrices.move_to_end(key)
+		_butter_matrix_evict()
+	return M
+
+
+def _butter_matrix_capacity(Q):
+	'''
+	Number of (Q,Q) filter operators that fit in the operator cache
+	'''
+	return butter_matrix_cache_bytes // (8 * Q * Q)
+
+
+def _butter_matrix_evict():   #evict least recently used operators (call with _butter_matrices_lock held)
+	nbytes    = sum( 8 * key[2]**2  for key in _butter_matrices )
+	while _butter_matrices and (nbytes > butter_matrix_cache_bytes):
+		key,_ = _butter_matrices.popitem(last=False)
+		nbytes -= 8 * key[2]**2
+
+
+def _butter_wn(dt, cutoff, order):
+	cutoff    = cutoff / ( 2**0.5 - 1 ) ** (0.5/order)
+	return float( 2*cutoff*dt )
+
+
+def butter_lowpass(y, dt, cutoff, order=2, axis=-1, workers=1):
 	'''
 	Lowpass Butterworth filter
 	
+	Filter designs are cached as second-order sections, and filtering is
+	applied along the time axis, so arbitrary stacks of measurements can be
+	filtered in a single call.
+	
 	INPUTS:
 	
-	*y* : 1D measurement ( (Q,) array )
+	*y* : 1D measurement ( (Q,) array ) or a stack of 1D measurements ( (...,Q) array )
 	
 	*dt* : inter-node duration = (1 / sampling frequency)
 	
@@ -46,17 +166,192 @@ def butter_lowpass(y, dt, cutoff, order=2):
 	
 	*order* : filter order (int)
 
+	*axis* : time axis of y (int)
+	
+	*workers* : number of threads across which channels are split (int;  -1 = all CPUs)
+
 	OUTPUTS:
 	
-	*ys* : smoothed 1D measurement ( (Q,) array )
+	*ys* : smoothed 1D measurement(s) (same shape as y)
 	'''
-	cutoff    = cutoff / ( 2**0.5 - 1 ) ** (0.5/order)
-	b,a       = scipy.signal.butter(order, 2*cutoff*dt, btype='lowpass')
-	fdata     = scipy.signal.filtfilt( b, a, y, padtype='odd')
-	return fdata
+	sos       = _butter_sos(order, _butter_wn(dt, cutoff, order))
+	fn        = lambda x: scipy.signal.sosfiltfilt(sos, x, axis=-1, padtype='odd')
+	return np.moveaxis( _channels(fn, y, axis, workers), -1, axis )
+
+
+def butter_lowpass_multi(y, dt, cutoffs, order=2, axis=-1, workers=1):
+	'''
+	Lowpass Butterworth filter for multiple cut-off frequencies
+	
+	All cut-off frequencies are applied in one tensor product using cached
+	linear operators (one per cut-off frequency and continuum size). Each
+	cut-off is instead filtered separately for long continua (Q > 256), for
+	more cut-offs than can be cached, and, for fewer rows than nodes, until
+	the same cut-offs are requested again (as building the operators would
+	cost more than filtering directly).
+	
+	INPUTS:
+	
+	*y* : 1D measurement ( (Q,) array ) or a stack of 1D measurements ( (...,Q) array )
+	
+	*dt* : inter-node duration = (1 / sampling frequency)
+	
+	*cutoffs* : cut-off frequencies (Hz) (list or array of int or float)
+	
+	*order* : filter order (int)
 
+	*axis* : time axis of y (int)
+	
+	*workers* : number of threads across which channels are split (int;  -1 = all CPUs)
 
-def embed(time, y, cutoffs=None, order=2):
+	OUTPUTS:
+	
+	*ys* : smoothed 1D measurements ( (ncut,Q) or (...,ncut,Q) array );  for
+	axis other than -1, the cut-off dimension is inserted before the time axis
+	'''
+	y         = np.asarray(y, dtype=float)
+	axis      = axis % y.ndim
+	cutoffs   = np.ravel(cutoffs)
+	operators = cutoffs.size <= _butter_matrix_capacity( y.shape[axis] )
+	ys        = _channels(lambda x: _butter_lowpass_multi(x, dt, cutoffs, order, operators), y, axis, workers)
+	return np.moveaxis( ys, (-2,-1), (axis,axis+1) )
+
+
+def _butter_lowpass_multi(y, dt, cutoffs, order, operators=True):
+	'''
+	(operators=False:  always filter each cut-off separately)
+	'''
+	Q         = y.shape[-1]
+	rows      = y.size // max(Q, 1)
+	M         = None
+	if operators and (Q <= _butter_matrix_max_nodes):
+		M     = [_butter_matrix(order, _butter_wn(dt, c, order), Q, defer=(rows < Q))  for c in cutoffs]
+	if (M is None) or any(m is None  for m in M):   #filter each cut-off separately
+		return np.stack([butter_lowpass(y, dt, c, order=order)  for c in cutoffs], axis=-2)
+	return np.tensordot(y, np.array(M), axes=([-1],[1]))
+
+
+class ButterworthStream(object):
+	'''
+	Streaming lowpass Butterworth filter for live (chunked) data
+
+	Uses the same (cutoff-corrected) design as "butter_lowpass", with filter
+	states kept between calls, so chunks of any size can be filtered as they
+	arrive. Any number of channels can be filtered at once:  chunks are
+	(...,n) arrays, where n is the number of new samples and the leading
+	dimensions (channels) are fixed by the first chunk.
+
+	Two modes are available:
+
+	- causal (lag=None):  a single forward pass;  zero latency, but with phase lag
+
+	- fixed-lag (lag=L):  a forward pass as in causal mode, followed by a backward
+	  pass over the most recent L+n samples, which approximates the zero-phase
+	  output of "butter_lowpass";  output is delayed by L samples.  The
+	  approximation improves as L increases relative to the filter's time constant
+	  (approximately 1/cutoff seconds).
+
+	Latency and memory are constant, regardless of recording length.
+
+	INPUTS:
+
+	*dt* : inter-node duration = (1 / sampling frequency)
+
+	*cutoff* : cut-off frequency (Hz) (int or float)
+
+	*order* : filter order (int)
+
+	*lag* : fixed lag (number of samples), or None for causal filtering
+
+	*axis* : time axis of the chunks (int)
+
+	Example:
+
+	>>> stream = smooth1d.smooth.ButterworthStream(0.01, 5, order=2, lag=100)
+	>>> for chunk in chunks:   # (nchannels, n) arrays
+	>>>     ys = stream.filter(chunk)   # (nchannels, m) array, delayed by 100 samples
+	>>> ys = stream.filter( np.zeros((nchannels, 0)) )   # empty chunk:  (nchannels, 0) array;  the filter state is unchanged
+	>>> ys = stream.flush()   # final 100 samples
+	'''
+	def __init__(self, dt, cutoff, order=2, lag=None, axis=-1):
+		assert (lag is None) or (isinstance(lag, int) and (lag>=0)), 'lag must be None or a non-negative integer'
+		self.dt        = dt
+		self.cutoff    = cutoff
+		self.order     = order
+		self.lag       = 0 if lag is None else lag
+		self.axis      = axis
+		self.sos       = _butter_sos(order, _butter_wn(dt, cutoff, order))
+		self.zi0       = scipy.signal.sosfilt_zi(self.sos)   #steady-state filter state for a unit step, (nsections,2)
+		self.zi        = None   #forward filter state, (nsections,...,2)
+		self.history   = None   #forward-filtered samples awaiting the backward pass, (...,lag)
+
+	def __repr__(self):
+		mode  = 'causal' if self.lag==0 else 'fixed-lag (%d samples)' %self.lag
+		return 'ButterworthStream(cutoff=%s, order=%d, %s)' %(self.cutoff, self.order, mode)
+
+	def _backward(self, x):
+		return scipy.signal.sosfilt(self.sos, x[...,::-1], axis=-1, zi=self._steady_state(x[...,-1]))[0][...,::-1]
+
+	def _steady_state(self, x0):   #filter state for a constant input x0, (nsections,...,2)
+		return self.zi0.reshape( (self.zi0.shape[0],) + (1,)*x0.ndim + (2,) ) * x0[...,None]
+
+	def filter(self, y):
+		'''
+		Filter a chunk of new samples
+
+		*y* : (...,n) array, n new samples for each channel (along "axis")
+
+		Returns a (...,m) array of filtered samples;  in causal mode m=n, and in
+		fixed-lag mode m is the number of samples that are now at least "lag"
+		samples old (m=n once "lag" samples have been received). Empty chunks
+		(n=0) are allowed, and return (...,0) arrays.
+		'''
+		return np.moveaxis( self._filter( np.moveaxis(np.asarray(y, dtype=float), self.axis, -1) ), -1, self.axis )
+
+	def _filter(self, y):
+		if y.shape[-1] == 0:   #empty chunk:  no output, filter state unchanged
+			if self.history is not None:
+				assert y.shape[:-1] == self.history.shape[:-1], 'Chunk shape (%s) is inconsistent with previous chunks (%s)' %(y.shape[:-1], self.history.shape[:-1])
+			return np.zeros(y.shape)
+		if self.zi is None:   #initialize forward state to the steady state for the first sample
+			self.zi      = self._steady_state(y[...,0])
+			self.history = np.zeros( y.shape[:-1] + (0,) )
+		assert y.shape[:-1] == self.history.shape[:-1], 'Chunk shape (%s) is inconsistent with previous chunks (%s)' %(y.shape[:-1], self.history.shape[:-1])
+		f,self.zi = scipy.signal.sosfilt(self.sos, y, axis=-1, zi=self.zi)
+		if self.lag == 0:
+			return f
+		x         = np.concatenate([self.history, f], axis=-1)
+		m         = max(0, x.shape[-1] - self.lag)
+		self.history = x[...,m:]
+		if m == 0:
+			return x[...,:0]
+		return self._backward(x)[...,:m]
+
+	def flush(self):
+		'''
+		Return the remaining (most recent) samples held for the backward pass
+
+		(Call at the end of a recording in fixed-lag mode;  the filter is then reset.)
+		'''
+		x         = self.history
+		self.reset()
+		if (x is None) or (x.shape[-1] == 0):
+			return x if x is None else np.moveaxis(x, -1, self.axis)
+		return np.moveaxis( self._backward(x), -1, self.axis )
+
+	def get_latency(self):
+		'''
+		Output latency (s)
+		'''
+		return self.lag * self.dt
+
+	def reset(self):
+		self.zi        = None
+		self.history   = None
+
+
+
+def embed(time, y, cutoffs=None, order=2, axis=-1, workers=1):
 	'''
 	Embed a measurement in an abstract 2D time-cutoff space
 	
@@ -64,65 +359,83 @@ def embed(time, y, cutoffs=None, order=2):
 	
 	*time* : 1D time vector ( (Q,) array )
 	
-	*y* : 1D measurement ( (Q,) array )
+	*y* : 1D measurement ( (Q,) array ) or a stack of 1D measurements ( (...,Q) array )
 	
 	*cutoffs* : cut-off frequencies (Hz) (list of int or float)
 	
 	*order* : filter order (int)
 
+	*axis* : time axis of y (int)
+	
+	*workers* : number of threads across which channels are split (int;  -1 = all CPUs)
+
 	OUTPUTS:
 	
-	*Ys* : smoothed, embedded 1D measurement ( (J,Q) array )
+	*Ys* : smoothed, embedded 1D measurement ( (ncut,Q) or (...,ncut,Q) array )
 	'''
 	dt      = time[1] - time[0]
 	cutoffs = cutoffs if cutoffs is not None else np.linspace(5, 10, 50)
-	ncut    = cutoffs.size
-	if y.ndim == 1:
-		ye    = np.array([butter_lowpass(y, dt, xx, order=order)  for xx in cutoffs])
-	elif y.ndim == 2:
-		J,Q   = y.shape
-		ye    = np.zeros( (J,ncut,Q) )
-		for i,xx in enumerate(cutoffs):
-			ye[:,i,:] = butter_lowpass(y, dt, xx, order=order)
-	return ye
+	return butter_lowpass_multi(y, dt, cutoffs, order=order, axis=axis, workers=workers)
 
 
 
-def _filtmat(dt, cutoff, order, data):
+def _autocorr_objective(resid):
 	'''
-	(Code translated from a MATLAB implementation written by John Challis; 
-	MATLAB code received by email without license)
+	Autocorrelation objective function for a stack of residuals ( (...,Q) array )
+	
+	Equivalent to:  sum( abs( acorr / acorr.max() ) )  where
+	acorr = np.correlate(resid, resid, mode='full'), but computed using FFTs
 	'''
-	return butter_lowpass(data, dt, cutoff, order)
+	Q     = resid.shape[-1]
+	n     = scipy.fft.next_fast_len(2*Q - 1)
+	F     = np.fft.rfft(resid, n=n, axis=-1)
+	acorr = np.fft.irfft(F.real**2 + F.imag**2, n=n, axis=-1)[...,:Q]  #lags 0, 1, ... Q-1
+	a0    = acorr[...,0]  #zero-lag (maximum) autocorrelation
+	return ( 2*np.abs(acorr).sum(axis=-1) - np.abs(a0) ) / a0
 
 
+def _autocorr_search(y, dt, order, cutoffs, chunk_size=16):
+	'''
+	Optimum smoothed signals and cutoffs for all rows of y ( (J,Q) array )
+	
+	Candidate cutoffs are evaluated in chunks, each chunk vectorized across
+	all rows and cutoffs. Cached filter operators are used only if all
+	candidate cutoffs fit in the operator cache;  otherwise every call would
+	evict the operators before they are reused.
+	'''
+	J,Q   = y.shape
+	operators = cutoffs.size <= _butter_matrix_capacity(Q)
+	fmin  = np.full(J, np.inf)
+	coopt = np.full(J, np.nan)
+	s     = np.empty((J,Q))
+	for i0 in range(0, cutoffs.size, chunk_size):
+		co    = cutoffs[i0:i0+chunk_size]
+		ys    = _butter_lowpass_multi(y, dt, co, order, operators)   #(J,nco,Q)
+		f     = _autocorr_objective( ys - y[:,None,:] )         #(J,nco)
+		k     = f.argmin(axis=1)
+		fk    = f[np.arange(J), k]
+		i     = fk < fmin   #keep the first (lowest-cutoff) minimum
+		fmin[i]  = fk[i]
+		coopt[i] = co[k[i]]
+		s[i]     = ys[i, k[i]]
+	return s, coopt
 
-def _autocorr(nsignal, dt, order):
+
+def _autocorr(y, dt, order):
 	'''
 	(Code translated from a MATLAB implementation written by John Challis; 
 	MATLAB code received by email without license)
+	
+	Vectorized across all rows of y ( (J,Q) array ) and all candidate cutoffs.
 	'''
 	colow = 0.5
 	coup  = 0.25 / dt
-	for i,co in enumerate(np.arange(colow, coup+0.1, 0.1)):
-		ssignal = _filtmat(dt, co, order, nsignal)
-		resid   = ssignal - nsignal
-		acorr   = np.correlate(resid, resid, mode='full')
-		acorr  /= acorr.max()
-		f       = np.sum( np.abs(acorr) )
-		if i==0:
-			fmin  = f         #objective function
-			coopt = co        #(currently) optimum cutoff frequency
-			s     = ssignal   #(currently) optimally smoothed signal
-		if f < fmin:
-			fmin  = f
-			coopt = co
-			s     = ssignal
-	return s,coopt
-
-
-
-def autocorr(y, order=2, time=None):
+	co    = np.arange(colow, coup+0.1, 0.1)   #candidate cutoff frequencies
+	return _autocorr_search(y, dt, order, co)
+
+
+
+def autocorr(y, order=2, time=None, axis=-1, workers=1):
 	'''
 	Autocorrelation filtering method.
 	
@@ -134,87 +447,341 @@ def autocorr(y, order=2, time=None):
 	Challis JH (1999). A procedure for the automatic determination of filter
 	cutoff frequency for the processing of biomechanical data. Journal of
 	Applied Biomechanics 15, 303–317.
+	
+	INPUTS:
+	
+	*y* : 1D measurement ( (Q,) array ) or a stack of 1D measurements ( (...,Q) array )
+	
+	*order* : filter order (int)
+	
+	*time* : 1D time vector ( (Q,) array )
+
+	*axis* : time axis of y (int)
+	
+	*workers* : number of threads across which channels are split (int;  -1 = all CPUs)
+
+	OUTPUTS:
+	
+	*ys* : smoothed 1D measurement(s) (same shape as y)
 	'''
 	dt    = 1 if time is None else time[1] - time[0]
-	if y.ndim == 1:
-		ys,cutoff = _autocorr(y, dt, order)
-	else:
-		ys,xopt   = [],[]
-		for yy in y:
-			s,c   = _autocorr(yy, dt, order)
-			ys.append(s)
-			xopt.append(c)
-		ys,cutoff = np.array(ys), np.array(xopt)
-	return ys
+	def fn(y):
+		yy    = y.reshape(-1, y.shape[-1])
+		ys    = np.empty(yy.shape)
+		for i in range(0, yy.shape[0], 256):   #blocks of rows limit memory use
+			ys[i:i+256] = _autocorr(yy[i:i+256], dt, order)[0]
+		return ys.reshape(y.shape)
+	return np.moveaxis( _channels(fn, y, axis, workers), -1, axis )
 
 
 
-def _gcvspl(x, y, m=2, library='gcvspl.so'):
+@lru_cache(maxsize=32)
+def _gcvspl_basis(xbytes, m):
 	'''
-	Generalized cross-validatory spline filtering 
+	Demmler-Reinsch basis for natural smoothing splines of half-order m
 	
-	(Using this function requires a compiled dynamic link library.)
-	(This code is distributed with a library called "gcvspl.so" which
-	was compiled for Mac using the source code from Twisk (1994), link below.)
+	The natural spline of degree (2m-1) minimizing:
 	
-	https://isbweb.org/resources/software-resources/137-signal-processing-software/497-gcvspl-in-c-d-twisk
+	    sum( (y - s(x))**2 ) + lam * integral( s^(m)(x)**2 )
 	
-	Reference:
+	has fitted values:  ys = U diag( 1/(1+lam*d) ) U.T y,  where (d,U) are
+	the eigenvalues and eigenvectors of the penalty matrix K that gives the
+	penalty of the natural spline interpolating the fitted values.
 	
-	Craven P, Wahba G (1979). Smoothing noisy data with splines functions. Numerische Mathematik 31, 377–403.
+	K = D.T R^-1 D (see "_gcvspl_banded_system"), so (d,U) are computed from
+	the singular value decomposition of L^-1 D, where R = L L.T. The smallest
+	positive eigenvalues decrease approximately as n**(-2m);  computed as
+	squared singular values they are resolved down to about 1e-32 * d.max()
+	(e.g. n=500 with m=5), rather than 1e-16 * d.max() for an eigendecomposition
+	of K itself (which fails e.g. for n=128 with m=5).
+	
+	OUTPUTS:
+	
+	*d* : (n,) array, penalty eigenvalues in ascending order (m of which are zero)
+	
+	*U* : (n,n) array, penalty eigenvectors
 	'''
-	### load DLL:
-	fnameSO    = os.path.join( os.path.dirname(__file__), library)
-	L          = ctypes.CDLL(fnameSO)
-	### assemble required variable types
-	c_int      = ctypes.c_int
-	c_double   = ctypes.c_double
-	p_double   = np.ctypeslib.ndpointer(ctypes.c_double)
-	p_int      = np.ctypeslib.ndpointer(ctypes.c_int32)
-	### specify argument types
-	L.gcvspl.argtypes = [p_double, p_double, p_double, c_int, c_int, p_double, c_double, p_double, c_int]
-	L.splder.argtypes = [c_int, c_int, c_int, c_double, p_double, p_double, p_int, p_double]
-	L.splder.restype  = c_double
-	
-	K   = 1
-	NN  = x.size
-
-	MM  = 10
-	MM2 = 2*MM
-	NWK = NN+6*(NN*MM+1)
-
-	c  = np.zeros(NN)
-	wk = np.zeros(NWK)
-	q  = np.zeros(MM+1)
-	v  = np.zeros(MM2)
-	q0 = np.zeros(NN)
-	q1 = np.zeros(NN)
-	q2 = np.zeros(NN)
-
-	wy    = 1.0
-	wx    = np.ones(NN)
-	n     = NN
-	var   = -1.0
-	ier   = 0
-	L.gcvspl(x, y, wx, m, n, c, var, wk, ier)
-
-	Q         = NN
-	ider      = 0  #derivative order
-	t         = x.copy()
-	l         = 2 * np.ones(Q, dtype=np.int32)
-	q         = np.zeros(2*m)
-	a         = np.array([L.splder(ider, m, n, tt, x, c, l, q)  for tt in t])
-	return a
-
-
-
-def gcvspl(x, y, m=3):
+	D,P,R,Rs = _gcvspl_banded_system(xbytes, m)
+	n      = D.shape[1]
+	L      = scipy.linalg.cholesky(Rs.toarray(), lower=True)
+	A      = scipy.linalg.solve_triangular(L, D.toarray(), lower=True)   #(n-m,n)
+	_,sv,Vt = np.linalg.svd(A)   #sv in descending order;  last m rows of Vt: null space (polynomials of degree < m)
+	d      = np.hstack( [np.zeros(m), sv[::-1]**2] )
+	U      = np.vstack( [Vt[n-m:], Vt[:n-m][::-1]] ).T
+	return d, U
+
+
+_gcvspl_max_nodes  = 1000   #maximum continuum size for the dense (Demmler-Reinsch) engine;  longer continua use the banded engine
+_gcvspl_block_size = 256    #number of rows searched at once (limits memory use)
+
+
+def _gcvspl(x, y, m=3, nlam=(60,40)):
+	'''
+	Generalized cross-validatory spline filtering for all rows of y ( (J,Q) array )
+	
+	The smoothing parameter is chosen separately for each row by minimizing
+	the generalized cross-validation (GCV) criterion:
+	
+	    V(lam) = Q * RSS(lam) / trace( I - A(lam) )**2
+	
+	first on a coarse logarithmic grid and then on a fine grid around the
+	coarse minimum.
+	
+	Continua with up to "_gcvspl_max_nodes" nodes use a cached (Q,Q)
+	Demmler-Reinsch basis (O(Q**3) time and O(Q**2) memory, once per (x,m)),
+	with which the search is vectorized across rows and grid points (in blocks
+	of "_gcvspl_block_size" rows, to limit memory use). Longer continua use a
+	banded solver (O(Q) time and memory);  see "_gcvspl_banded".
+	'''
+	if y.shape[-1] > _gcvspl_max_nodes:
+		return _gcvspl_banded(x, y, m, nlam)
+	return _gcvspl_dense(x, y, m, nlam)
+
+
+def _gcvspl_dense(x, y, m=3, nlam=(60,40)):
+	d,U    = _gcvspl_basis( np.ascontiguousarray(x, dtype=float).tobytes(), m )
+	J,Q    = y.shape
+	z      = y @ U   #Demmler-Reinsch coordinates (J,Q)
+	dpos   = d[d > 0]
+	lo,hi  = -np.log10( dpos.max() ) - 2, -np.log10( dpos.min() ) + 2
+	### coarse grid (shared by all rows):
+	loglam = np.linspace(lo, hi, nlam[0])
+	step   = loglam[1] - loglam[0]
+	r      = 1 - 1 / (1 + 10**loglam[:,None] * d)   #(nlam,Q) diagonal of I-A
+	V      = (z**2 @ (r**2).T) / r.sum(axis=1)**2     #(J,nlam)
+	loglam = loglam[ V.argmin(axis=1) ]
+	### fine grid (one per row, in blocks of rows):
+	loglam = loglam[:,None] + step * np.linspace(-1, 1, nlam[1])   #(J,nlam)
+	lam    = np.empty(J)
+	for i in range(0, J, _gcvspl_block_size):
+		ll     = loglam[i:i+_gcvspl_block_size]
+		r      = 1 - 1 / (1 + 10**ll[:,:,None] * d)                #(b,nlam,Q)
+		V      = np.einsum('jq,jlq->jl', z[i:i+_gcvspl_block_size]**2, r**2) / r.sum(axis=2)**2
+		lam[i:i+_gcvspl_block_size] = 10**ll[ np.arange(ll.shape[0]), V.argmin(axis=1) ]
+	return ( z / (1 + lam[:,None] * d) ) @ U.T
+
+
+def _gcvspl_dense_fit(x, y, m, lam):
+	'''
+	Natural smoothing spline fitted values for a fixed smoothing parameter (dense engine)
+	
+	*lam* : smoothing parameter, in node units (see "_gcvspl_basis")
+	'''
+	d,U    = _gcvspl_basis( np.ascontiguousarray(x, dtype=float).tobytes(), m )
+	return ( (y @ U) / (1 + lam * d) ) @ U.T
+
+
+@lru_cache(maxsize=8)
+def _gcvspl_banded_system(xbytes, m):
+	'''
+	Banded (generalized Reinsch) form of the natural smoothing spline of half-order m
+	
+	For a natural spline s with values f at the nodes, s^(m) is a spline of
+	degree (m-1) in the span of the B-splines M_i of order m on nodes i to i+m
+	(normalized to unit integral), and the penalty is:
+	
+	    integral( s^(m)(x)**2 ) = f.T D.T R^-1 D f
+	
+	where D is the (n-m,n) matrix of m-th divided differences (scaled by m!,
+	so that D f = integral( M_i s^(m) )) and R is the (n-m,n-m) Gram matrix of
+	the M_i. Both are banded, and the fitted values are:
+	
+	    ys = y - D.T g,   where   (D D.T + R / lam) g = D y
+	
+	Both D D.T and R are positive definite, but the smallest eigenvalues of
+	D D.T decrease approximately as n**(-2m), so for long continua and high m
+	the system is ill-conditioned for very large lam (very smooth fits);  see
+	"_gcvspl_banded_solve".
+	
+	OUTPUTS:
+	
+	*D* : (n-m,n) sparse divided difference matrix (CSR)
+	
+	*P*, *R* : (m+1,n-m) arrays, lower band storage of D D.T and R:  P[d,j] = (D D.T)[j+d,j]
+	
+	*Rs* : R as a sparse matrix (for residuals;  see "_gcvspl_banded_solve")
+	'''
+	import scipy.interpolate
+	import scipy.sparse
+	x      = np.frombuffer(xbytes)
+	x      = (x - x[0]) / (x[-1] - x[0]) * (x.size - 1)   #node units (as in "_gcvspl_basis")
+	n      = x.size
+	### divided differences:
+	D      = scipy.sparse.identity(n, format='csr')
+	for r in range(1, m+1):
+		h  = 1 / (x[r:] - x[:-r])
+		D  = scipy.sparse.diags([-h, h], [0, 1], shape=(n-r, n-r+1), format='csr') @ D
+	D      = float( np.prod(np.arange(1, m+1)) ) * D
+	### Gram matrix of unit-integral B-splines of order m (Gauss-Legendre quadrature is exact here):
+	k      = m - 1
+	t      = np.hstack( [x[0] - np.arange(k, 0, -1), x, x[-1] + np.arange(1, k+1)] )   #extra knots:  all M_i are evaluated on [x[0],x[-1]]
+	g,w    = np.polynomial.legendre.leggauss(m)
+	h,c    = 0.5*np.diff(x), 0.5*(x[:-1] + x[1:])
+	xq     = (c[:,None] + h[:,None]*g).ravel()
+	wq     = (h[:,None]*w).ravel()
+	N      = scipy.interpolate.BSpline.design_matrix(xq, t, k).tocsc()[:, k:k+n-m]
+	N      = N @ scipy.sparse.diags( m / (x[m:] - x[:-m]) )   #unit integral
+	R      = (N.T @ scipy.sparse.diags(wq) @ N).todia()
+	P      = (D @ D.T).todia()
+	band   = lambda A: np.array([np.hstack([A.diagonal(-d), np.zeros(d)])  for d in range(m+1)])
+	P,Rs   = band(P), R
+	R      = band(Rs)
+	return D, P, R, Rs.tocsr()
+
+
+def _gcvspl_banded_trace(P, L):
+	'''
+	trace( I - A(lam) ) = trace( (P + R/lam)^-1 P ) for multiple smoothing parameters
+	
+	Only the elements of (P + R/lam)^-1 within the band of P are needed;
+	these are computed from the Cholesky factors using the Takahashi
+	(selected inverse) recursion, vectorized across smoothing parameters.
+	
+	*P* : (b+1,p) array, lower band storage (see "_gcvspl_banded_system")
+	
+	*L* : (nlam,b+1,p) array, lower banded Cholesky factors of (P + R/lam)
+	'''
+	nl,b1,p = L.shape
+	b      = b1 - 1
+	dg     = L[:,0]**2                                 #LDL' decomposition:  D
+	Lu     = L[:,1:] / L[:,:1]                         #unit lower factor:  Lu[:,d-1,j] = L[j+d,j]
+	Lu     = Lu * ( np.arange(p) + np.arange(1,b1)[:,None] < p )   #zero entries beyond the matrix
+	S      = np.zeros( (nl,b,b) )                      #inverse elements for rows/columns j+1 ... j+b
+	tr     = np.zeros(nl)
+	for j in range(p-1, -1, -1):
+		l      = Lu[:,:,j]
+		soff   = -np.einsum('nab,nb->na', S, l)
+		sjj    = 1 / dg[:,j] - (l * soff).sum(axis=1)
+		tr    += sjj * P[0,j] + 2 * soff @ P[1:,j]
+		S[:,1:,1:] = S[:,:-1,:-1]
+		S[:,0,0]   = sjj
+		S[:,0,1:]  = soff[:,:-1]
+		S[:,1:,0]  = soff[:,:-1]
+	return tr
+
+
+def _gcvspl_banded_solve(D, Rs, lam, L, b, maxiter=50, rtol=1e-12):
+	'''
+	Solve (D D.T + R / lam) g = b using the Cholesky factor L and iterative refinement
+	
+	The residuals are computed from D and R (rather than from the band of D D.T).
+	For large lam and high m, where the system is ill-conditioned, refinement
+	reduces the error of the fitted values by several orders of magnitude, but
+	converges more slowly;  it stops when the correction is below rtol (relative
+	to g), when the correction stops decreasing (refinement cannot converge if
+	the system is numerically singular) or after maxiter iterations.
+	
+	*b* : (n-m,) or (n-m,J) array
+	'''
+	g      = scipy.linalg.cho_solve_banded((L, True), b)
+	e0     = np.inf
+	for i in range(maxiter):
+		r  = b - D @ (D.T @ g) - (Rs @ g) / lam
+		dg = scipy.linalg.cho_solve_banded((L, True), r)
+		e  = np.abs(dg).max()
+		if e >= e0:   #diverging
+			break
+		g  = g + dg
+		e0 = e
+		if e <= rtol * np.abs(g).max():
+			break
+	return g
+
+
+def _gcvspl_banded_fit(x, y, m, lam, trace=False):
+	'''
+	Natural smoothing spline fitted values for all rows of y ( (J,Q) array ) for
+	a fixed smoothing parameter (banded engine)
+	
+	*lam* : smoothing parameter, in node units (see "_gcvspl_basis")
+	
+	*trace* : if True, also return trace( A(lam) )
+	'''
+	D,P,R,Rs = _gcvspl_banded_system( np.ascontiguousarray(x, dtype=float).tobytes(), m )
+	L      = scipy.linalg.cholesky_banded(P + R / lam, lower=True)
+	ys     = y - ( D.T @ _gcvspl_banded_solve(D, Rs, lam, L, D @ y.T) ).T
+	if trace:
+		return ys, y.shape[-1] - _gcvspl_banded_trace(P, L[None])[0]
+	return ys
+
+
+@lru_cache(maxsize=8)
+def _gcvspl_lam_range(n, m):
+	'''
+	Search range for log10(lam) for n nodes
+	
+	The extreme penalty eigenvalues (in node units) are computed for a 200-node
+	uniform grid:  the largest is approximately independent of n, and the
+	smallest positive eigenvalue scales approximately as n**(-2m).
+	'''
+	n0     = 200
+	d      = _gcvspl_basis( np.arange(n0, dtype=float).tobytes(), m )[0]
+	dpos   = d[d > 0]
+	lo     = -np.log10( dpos.max() ) - 2
+	hi     = -np.log10( dpos.min() ) + 2*m*np.log10( (n-1) / (n0-1) ) + 2
+	return lo, hi
+
+
+def _gcvspl_banded(x, y, m=3, nlam=(60,40)):
+	'''
+	Banded engine for "_gcvspl" (O(Q) time and memory per smoothing parameter)
+	
+	Each grid point requires a banded Cholesky decomposition (shared by all rows),
+	a banded solve for all rows and the trace of I minus the influence matrix
+	(see "_gcvspl_banded_system" and "_gcvspl_banded_trace"). The fine grid is
+	evaluated once for each distinct coarse minimum, for all rows sharing that
+	minimum.
+	
+	Smoothing parameters for which (D D.T + R / lam) is numerically singular
+	(very smooth fits of long continua with high m) are excluded from the search.
+	The relative error of the trace grows with the condition number of
+	(D D.T + R / lam);  for m >= 4 and very smooth fits (large lam) this biases
+	the GCV criterion (e.g. toward smaller lam for m=5), which is why continua
+	with up to "_gcvspl_max_nodes" nodes use the dense engine.
+	'''
+	D,P,R,Rs = _gcvspl_banded_system( np.ascontiguousarray(x, dtype=float).tobytes(), m )
+	J,Q    = y.shape
+	Dy     = D @ y.T   #(n-m,J)
+	def cholesky(lam):
+		try:
+			return scipy.linalg.cholesky_banded(P + R / lam, lower=True)
+		except np.linalg.LinAlgError:
+			return None
+	def evaluate(loglam, rows):   #GCV scores and fitted values:  (nlam,nrows), (nlam,nrows,Q)
+		L  = [cholesky(10**ll)  for ll in loglam]
+		ok = np.array([Li is not None  for Li in L])
+		V  = np.full( (loglam.size, rows.size), np.inf )
+		e  = np.zeros( (loglam.size, rows.size, Q) )
+		if ok.any():
+			L  = np.array([Li  for Li in L  if Li is not None])
+			tr = _gcvspl_banded_trace(P, L)   #trace( I - A )
+			e[ok] = [( D.T @ _gcvspl_banded_solve(D, Rs, 10**ll, Li, Dy[:,rows]) ).T  for ll,Li in zip(loglam[ok],L)]   #residuals
+			V[ok] = (e[ok]**2).sum(axis=-1) / tr[:,None]**2
+		return V, y[rows] - e
+	### coarse grid (shared by all rows):
+	lo,hi  = _gcvspl_lam_range(Q, m)
+	loglam = np.linspace(lo, hi, nlam[0])
+	step   = loglam[1] - loglam[0]
+	V,_    = evaluate(loglam, np.arange(J))
+	icoarse = V.argmin(axis=0)
+	### fine grid (one per distinct coarse minimum):
+	ys     = np.empty(y.shape)
+	for i in np.unique(icoarse):
+		rows   = np.flatnonzero(icoarse == i)
+		V,yf   = evaluate(np.minimum(loglam[i] + step * np.linspace(-1, 1, nlam[1]), hi), rows)
+		ys[rows] = yf[ V.argmin(axis=0), np.arange(rows.size) ]
+	return ys
+
+
+
+def gcvspl(x, y, m=3, axis=-1, workers=1):
 	'''
 	Generalized cross-validatory spline filtering 
 	
-	(Using this function requires a compiled dynamic link library.)
-	(This code is distributed with a library called "gcvspl.so" which
-	was compiled for Mac using the source code from Twisk (1994), link below.)
+	This is a NumPy implementation of the natural smoothing spline with
+	GCV-optimal smoothing of Woltring's GCVSPL (mode 2, unit weights), as
+	previously accessed through a compiled library built from the C source
+	code of Twisk (1994):
 	
 	https://isbweb.org/resources/software-resources/137-signal-processing-software/497-gcvspl-in-c-d-twisk
 	
@@ -222,24 +789,32 @@ def gcvspl(x, y, m=3):
 	
 	Craven P, Wahba G (1979). Smoothing noisy data with splines functions. Numerische Mathematik 31, 377–403.
 	
+	Woltring HJ (1986). A Fortran package for generalized, cross-validatory spline smoothing and differentiation. Advances in Engineering Software 8, 104-113.
+	
 	
 	INPUTS:
 	
 	*x* : 1D time vector ( (Q,) array )
 	
-	*y* : 1D measurement ( (Q,) array )
+	*y* : 1D measurement ( (Q,) array ) or a stack of 1D measurements ( (...,Q) array )
 	
 	*m* : half-order (int);  spline degree = (2*m - 1)
 	
+	*axis* : time axis of y (int)
+	
+	*workers* : number of threads across which channels are split (int;  -1 = all CPUs)
+
 	OUTPUTS:
 	
-	*ys* : smoothed 1D measurement ( (J,Q) array )
+	*ys* : smoothed 1D measurement(s) (same shape as y)
 	'''
-	if y.ndim==2:
-		ys    = np.array([_gcvspl(x, yy, m) for yy in y])
-	else:
-		ys    = _gcvspl(x, y, m)
-	return ys
+	def fn(y):
+		yy    = y.reshape(-1, y.shape[-1])
+		ys    = np.empty(yy.shape)
+		for i in range(0, yy.shape[0], _gcvspl_block_size):   #blocks of rows limit memory use
+			ys[i:i+_gcvspl_block_size] = _gcvspl(x, yy[i:i+_gcvspl_block_size], m)
+		return ys.reshape(y.shape)
+	return np.moveaxis( _channels(fn, y, axis, workers), -1, axis )
 
 
 
@@ -259,46 +834,45 @@ def _ssa(x, L=5, ncomponents=2):
 	
 	Alonso, F.J., Del Castillo, J.M, Pintado, P., (2005), Application of singular spectrum analysis to the smoothing of raw kinematic signals. J. Biomech. 38, 1085-1092.
 	'''
-	#Step 1: Build trajectory matrix:
-	N = x.size
-	L = (N - L) if (L > N/2) else L
-	K = N - L + 1
-	X = np.zeros((L, K))
-	for i in range(K):
-		X[:L, i] = x[i:L+i]
-	X = np.matrix( X )
+	#Step 1: Build trajectory matrix (zero-copy Hankel view):
+	N  = x.shape[-1]
+	L  = (N - L) if (L > N/2) else L
+	K  = N - L + 1
+	X  = np.swapaxes( np.lib.stride_tricks.sliding_window_view(x, L, axis=-1), -1, -2 )  #(...,L,K)
 
-	#Step 2: SVD
-	U,s,v = np.linalg.svd(X)
-	V     = X.T * U
-	rc    = U * V.T
+	#Step 2: SVD (all trajectory matrices in one stacked SVD)
+	U     = np.linalg.svd(X, full_matrices=False)[0]
 
-	#Step 3: Grouping
-	I     = range(ncomponents)
-	rca   = U[:, I] * V.T[I]
+	#Step 3: Grouping (projection onto the leading components)
+	Ur    = U[..., :ncomponents]
+	rca   = Ur @ ( np.swapaxes(Ur, -1, -2) @ X )
 
-	#Step 4: Reconstruction
-	y  = np.zeros(N)
-	Lp = min(L, K)
-	Kp = max(L, K)
+	#Step 4: Reconstruction (diagonal averaging)
+	return _antidiagonal_sums(rca) / _antidiagonal_counts(L, K)
 
-	for k in range(0, Lp-1):
-		for m in range(k+1):
-			y[k] += (1.0/(k+1)) * rca[m,k-m]
 
-	for k in range(Lp-1, Kp):
-		for m in range(Lp):
-			y[k] += (1.0/Lp) * rca[m,k-m]
 
-	for k in range(Kp, N):
-		for m in range(k-Kp+1, N-Kp+1):
-			y[k] += (1.0/(N-k)) * rca[m,k-m]
+def _antidiagonal_sums(R):
+	'''
+	Sums along the anti-diagonals of (...,L,K) arrays;  returns a (...,L+K-1) array
+	'''
+	#  padding each row to length N+1 and re-reading the flattened rows with
+	#  length N shifts row m by m nodes, so anti-diagonals become columns
+	L,K   = R.shape[-2:]
+	N     = L + K - 1
+	shape = R.shape[:-2]
+	Z     = np.concatenate( [R, np.zeros(shape + (L,L))], axis=-1 ).reshape(shape + (L*(N+1),))
+	return Z[..., :L*N].reshape(shape + (L,N)).sum(axis=-2)
 
-	return y
 
+def _antidiagonal_counts(L, K):
+	N     = L + K - 1
+	n     = np.arange(N)
+	return np.minimum( np.minimum(n+1, N-n), min(L, K) )
 
 
-def ssa(y, L, ncomponents=2):
+
+def ssa(y, L, ncomponents=2, axis=-1, workers=1):
 	'''
 	Singular Spectrum Analysis smoother
 	
@@ -312,57 +886,186 @@ def ssa(y, L, ncomponents=2):
 	Golyandina, N., Nekrutkin,  V., Zhigljavsky, A., 2001. Analisys of Time Series Structure - SSA and Related Techniques. Chapman & Hall/CR
 	
 	Alonso, F.J., Del Castillo, J.M, Pintado, P., (2005), Application of singular spectrum analysis to the smoothing of raw kinematic signals. J. Biomech. 38, 1085-1092.
+	
+	INPUTS:
+	
+	*y* : 1D measurement ( (Q,) array ) or a stack of 1D measurements ( (...,Q) array )
+	
+	*L* : window length (int)
+	
+	*ncomponents* : number of leading components used for reconstruction (int)
+
+	*axis* : time axis of y (int)
+	
+	*workers* : number of threads across which channels are split (int;  -1 = all CPUs)
+
+	OUTPUTS:
+	
+	*ys* : smoothed 1D measurement(s) (same shape as y)
 	'''
-	if y.ndim==2:
-		ys    = np.array([_ssa(yy, L, ncomponents) for yy in y])
-	else:
-		ys    = _ssa(y, L, ncomponents)
-	return ys
+	fn    = lambda y: _ssa(y, L, ncomponents)
+	return np.moveaxis( _channels(fn, y, axis, workers), -1, axis )
+
+
 
+def ssa_windowed(y, L, ncomponents=2, window=1000, span=1, axis=-1, workers=1):
+	'''
+	Singular Spectrum Analysis smoother for long signals
+
+	The trajectory matrix is processed in blocks of "window" columns (i.e.
+	overlapping signal windows of window+L-1 nodes). The lag-covariance matrix
+	of each block is computed once, and the running covariance of the "span"
+	neighbouring blocks on either side is updated incrementally (the incoming
+	block is added and the outgoing block subtracted). Each block is projected
+	onto the leading eigenvectors of its running covariance (equivalent to the
+	leading left singular vectors of the local trajectory matrix), and diagonal
+	averaging is accumulated across blocks, so reconstructions stitch without
+	seams. Time and memory scale linearly with signal length.
+
+	When window is at least the number of trajectory matrix columns (Q-L+1),
+	results are equivalent to "ssa".
+
+	INPUTS:
+
+	*y* : 1D measurement ( (Q,) array ) or a stack of 1D measurements ( (...,Q) array )
+
+	*L* : window length (int)
+
+	*ncomponents* : number of leading components used for reconstruction (int)
+
+	*window* : number of trajectory matrix columns per block (int)
 
+	*span* : number of neighbouring blocks (on either side) used to estimate each block's components (int)
 
+	*axis* : time axis of y (int)
 
+	*workers* : number of threads across which channels are split (int;  -1 = all CPUs)
 
-def _wavelet_single(y):
+	OUTPUTS:
+
+	*ys* : smoothed 1D measurement(s) (same shape as y)
 	'''
-	Wachowiak (2000)
-	Following code from:
-	http://jseabold.net/blog/2012/02/23/wavelet-regression-in-python/
+	assert window >= 1, 'window must be a positive integer'
+	assert span >= 0, 'span must be a non-negative integer'
+	fn    = lambda y: _ssa_windowed(y, L, ncomponents, window, span)
+	return np.moveaxis( _channels(fn, y, axis, workers), -1, axis )
+
+
+def _ssa_windowed(x, L, ncomponents, window, span):
+	N     = x.shape[-1]
+	L     = (N - L) if (L > N/2) else L
+	K     = N - L + 1
+	X     = np.swapaxes( np.lib.stride_tricks.sliding_window_view(x, L, axis=-1), -1, -2 )  #(...,L,K)
+	edges = list( range(0, K, window) ) + [K]
+	nb    = len(edges) - 1
+	block = lambda b: X[..., edges[b]:edges[b+1]]
+	cov   = lambda b: block(b) @ np.swapaxes(block(b), -1, -2)   #(...,L,L)
+	C     = dict( (b,cov(b))  for b in range(min(span+1, nb)) )
+	Crun  = sum( C.values() )
+	ys    = np.zeros(x.shape)
+	for b in range(nb):
+		if b > 0:   #incremental update of the running covariance
+			if b+span < nb:
+				C[b+span] = cov(b+span)
+				Crun      = Crun + C[b+span]
+			if b-span-1 >= 0:
+				Crun      = Crun - C.pop(b-span-1)
+		Ur    = np.linalg.eigh(Crun)[1][..., ::-1][..., :ncomponents]
+		Xb    = block(b)
+		ys[..., edges[b]:edges[b+1]+L-1] += _antidiagonal_sums( Ur @ (np.swapaxes(Ur, -1, -2) @ Xb) )
+	return ys / _antidiagonal_counts(L, K)
+
+
+
+
+
+@lru_cache(maxsize=16)
+def _pywt_wavelet(name):
+	import pywt
+	return pywt.Wavelet(name)
+
+
+def _mad(x):
 	'''
-	yy,nadd  = paddon(y)
-	coefs    = pywt.wavedec(yy, 'db8', level=None, mode='per')
-	sigma    = mad( coefs[-1] )
-	uthresh  = sigma * sqrt( 2*log(len(y)) )
-	denoised = coefs[:]
-	denoised[1:] = (pywt.threshold(i, value=uthresh, mode='soft') for i in denoised[1:])
-	ys           = pywt.waverec(denoised, 'db8', mode='per')
-	ys           = paddoff(ys, nadd)
-	return ys
+	Median absolute deviation along the last axis, normalized to the standard
+	deviation of normally distributed data (equivalent to statsmodels.robust.mad)
+	'''
+	med      = np.median(x, axis=-1, keepdims=True)
+	return np.median( np.abs(x - med), axis=-1 ) / 0.6744897501960817   #norm.ppf(0.75)
 
 
-def wavelet(y):
+def wavelet(y, axis=-1, workers=1):
 	'''
 	Wachowiak (2000)
 	Following code from:
 	http://jseabold.net/blog/2012/02/23/wavelet-regression-in-python/
+	
+	Wavelet decomposition, thresholding and reconstruction are conducted
+	along the time axis, for all rows at once.
+	
+	INPUTS:
+	
+	*y* : 1D measurement ( (Q,) array ) or multiple measurements ( (...,Q) array )
+	
+	*axis* : time axis of y (int)
+	
+	*workers* : number of threads across which channels are split (int;  -1 = all CPUs)
+
+	OUTPUTS:
+	
+	*ys* : smoothed measurement(s) (same shape as y)
 	'''
-	if y.ndim == 1:
-		ys = _wavelet_single(y)
-	else:
-		ys = np.array([_wavelet_single(yy) for yy in y])
-	return ys
+	return np.moveaxis( _channels(_wavelet, y, axis, workers), -1, axis )
+
+
+def _wavelet(y):
+	import pywt   #optional dependency, imported on first use
+	Q        = y.shape[-1]
+	yy,nadd  = paddon(y)
+	w        = _pywt_wavelet('db8')
+	coefs    = pywt.wavedec(yy, w, level=None, mode='per', axis=-1)
+	sigma    = _mad( coefs[-1] )
+	uthresh  = ( sigma * sqrt( 2*log(Q) ) )[...,None]
+	coefs[1:] = [pywt.threshold(c, value=uthresh, mode='soft')  for c in coefs[1:]]
+	ys       = pywt.waverec(coefs, w, mode='per', axis=-1)
+	return ys[...,nadd:nadd+Q]
 
 
 
-def wiener(y, window_rel=0.05):
+def wiener(y, window_rel=0.05, window=None, axis=-1, workers=1):
 	'''
 	Weiner filter
 	
-	This is a convenience interface to scipy.signal.wiener
+	Equivalent to scipy.signal.wiener applied separately to each row, with
+	local means and variances computed for all rows at once along the time axis.
+	
+	INPUTS:
+	
+	*y* : 1D measurement ( (Q,) array ) or multiple measurements ( (...,Q) array )
+	
+	*window_rel* : window size relative to Q (float)
+	
+	*window* : window size (number of nodes;  if specified "window_rel" is ignored)
+	
+	*axis* : time axis of y (int)
+	
+	*workers* : number of threads across which channels are split (int;  -1 = all CPUs)
+
+	OUTPUTS:
+	
+	*ys* : smoothed measurement(s) (same shape as y)
 	'''
-	n          = y.size if y.ndim==1 else y.shape[1]
-	window     = round_up_to_odd( window_rel * n )
-	ys         = np.array([scipy.signal.wiener(yy, window, None) for yy in y])
-	return ys
+	fn         = lambda y: _wiener(y, window_rel, window)
+	return np.moveaxis( _channels(fn, y, axis, workers), -1, axis )
 
 
+def _wiener(y, window_rel, window):
+	import scipy.ndimage
+	n          = y.shape[-1]
+	window     = round_up_to_odd( window_rel * n ) if window is None else window
+	m          = scipy.ndimage.uniform_filter1d(y, window, axis=-1, mode='constant')
+	v          = scipy.ndimage.uniform_filter1d(y**2, window, axis=-1, mode='constant') - m**2
+	noise      = v.mean(axis=-1, keepdims=True)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		ys     = m + (y - m) * (1 - noise / v)
+	return np.where(v < noise, m, ys)
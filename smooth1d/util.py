@@ -5,7 +5,7 @@ A collection of utility functions.
 '''
 
 
-from math import floor,ceil
+from math import floor,ceil,log
 import numpy as np
 
 
@@ -36,7 +36,7 @@ def paddon(y):
 	
 	INPUTS:
 	
-	*y* : (1 x Q) array, 1D measurement
+	*y* : (1 x Q) array, 1D measurement (or (...,Q) array, padded along the last axis)
 	
 	OUTPUTS:
 	
@@ -44,8 +44,8 @@ def paddon(y):
 	
 	*nadd* : int, number of nodes added
 	'''
-	nadd = round( 0.3 * y.size )
-	yp   = np.pad(y, nadd, 'reflect')
+	nadd = round( 0.3 * y.shape[-1] )
+	yp   = np.pad(y, [(0,0)]*(y.ndim-1) + [(nadd,nadd)], 'reflect')
 	return yp,nadd
 
 
@@ -78,6 +78,29 @@ def round_up_to_odd(x):
 	return ceil(x) // 2 * 2 + 1
 
 
+def estimate_fwhm(r):
+	'''
+	Estimate field smoothness (FWHM) from a set of residuals
+	
+	This is a vectorized version of spm1d.rft1d.geom.estimate_fwhm
+	which supports arbitrary leading (batch) dimensions.
+	
+	INPUTS:
+	
+	*r* : (J x Q) or (N x J x Q) array, residuals
+	
+	OUTPUTS:
+	
+	*fwhm* : float or (N,) array, estimated FWHM (in node units)
+	'''
+	eps    = np.finfo(float).eps
+	ssq    = (r ** 2).sum(axis=-2)
+	dx     = np.gradient(r, axis=-1)
+	v      = (dx ** 2).sum(axis=-2) / (ssq + eps)
+	v      = np.sqrt(v / (4 * log(2)))
+	return 1 / np.nanmean(v, axis=-1)
+
+
 def prmse(y_orig, y_noisy):
 	'''
 	Percent root mean squared error (RMSE)
@@ -85,7 +108,7 @@ def prmse(y_orig, y_noisy):
 	INPUTS:
 	
 	y_orig:    (1 x Q) array
-	y_noisy:   (J x Q) array
+	y_noisy:   (J x Q) or (N x J x Q) array
 	
 	OUTPUTS:
 	
@@ -93,7 +116,7 @@ def prmse(y_orig, y_noisy):
 	'''
 	if y_noisy.ndim==1:
 		y_noisy = np.asarray([y_noisy])
-	rmse        = ((y_orig - y_noisy) ** 2).mean(axis=1) ** 0.5  #root-mean squared error
+	rmse        = ((y_orig - y_noisy) ** 2).mean(axis=-1) ** 0.5  #root-mean squared error
 	rms         = (y_orig ** 2).mean() ** 0.5   #root-mean squared value
 	return rmse / rms
 
@@ -105,11 +128,13 @@ def tstat(y):
 	INPUTS:
 	
 	*y* : (J x Q) array, collection of J datum-subtracted 1D measurements
+	      or (N x J x Q) array, a stack of N such collections
 	
 	OUTPUTS:
 	
-	*x* : (1 X Q) array, t statistic continuum
+	*x* : (1 X Q) or (N x Q) array, t statistic continuum
 	'''
-	return y.mean(axis=0) / (  y.std(ddof=1, axis=0)/ (y.shape[0])**0.5  )
+	J = y.shape[-2]
+	return y.mean(axis=-2) / (  y.std(ddof=1, axis=-2)/ (J)**0.5  )
 
 